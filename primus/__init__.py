@@ -4,3 +4,4 @@
 
 from .primus import PrimusClient
 from .feathers import FeathersClient
+from .manager import ConnectionManager, runSharded
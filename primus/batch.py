@@ -0,0 +1,96 @@
+import asyncio
+import logging
+
+
+class GetBatcher:
+    """Merges concurrent 'get' calls into batched 'find' calls (in the style of DataLoader)
+
+    Gets for the same record that overlap share one request.  Distinct ids asked for within one
+    window are fetched with a single find using an $in query and the results handed back to
+    each caller.  Ids the find doesn't return (or all of them, if the find fails) are fetched
+    with individual gets.
+    """
+
+    def __init__(self, client, window=0.0, maxBatch=50, idField='_id'):
+        """Constructor
+
+        :param client: The FeathersClient used to make the calls
+        :param window: Seconds to collect ids before sending a batch (0 means until the event
+                       loop gets back to us, i.e. all the gets issued in the same tick)
+        :param maxBatch: The most ids we will put in one find (servers usually cap $limit)
+        :param idField: The record field that identifies a record
+        """
+        self.client = client
+        self.window = window
+        self.maxBatch = maxBatch
+        self.idField = idField
+        self.inflight = {}  # (service, id) -> future for that record
+        self.queued = {}  # service -> list of ids waiting for the next batch
+        self.timer = None
+
+    def get(self, service, id):
+        """Return a future for a record, sharing any request already made for it"""
+        key = (service, id)
+        future = self.inflight.get(key)
+        if future is None:
+            loop = asyncio.get_event_loop()
+            future = loop.create_future()
+            self.inflight[key] = future
+            future.add_done_callback(lambda f: self.inflight.pop(key, None))
+            self.queued.setdefault(service, []).append(id)
+            if self.timer is None:
+                self.timer = loop.call_later(self.window, self.flush)
+        return future
+
+    def flush(self):
+        """Send all the queued gets now"""
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        queued, self.queued = self.queued, {}
+        for service, ids in queued.items():
+            for i in range(0, len(ids), self.maxBatch):
+                asyncio.ensure_future(self._fetch(service, ids[i:i + self.maxBatch]))
+
+    def _settle(self, service, id, record=None, ex=None):
+        future = self.inflight.get((service, id))
+        if future and not future.done():
+            if ex:
+                future.set_exception(ex)
+            else:
+                future.set_result(record)
+
+    async def _get(self, service, id):
+        """Fetch a single record with a plain get"""
+        try:
+            self._settle(service, id, await self.client.serverCall('get', service, id, {}))
+        except Exception as ex:
+            self._settle(service, id, ex=ex)
+
+    async def _fetch(self, service, ids):
+        if len(ids) == 1:
+            await self._get(service, ids[0])
+            return
+
+        logging.debug(f'Batching {len(ids)} gets from {service}')
+        query = {self.idField: {'$in': ids}, '$limit': len(ids)}
+        try:
+            result = await self.client.serverCall('find', service, query, {})
+            records = result.get('data', []) if isinstance(result, dict) else result
+            byId = {str(r.get(self.idField)): r for r in records}
+        except Exception as ex:
+            # i.e. the service allows get but not find (or answered with something odd)
+            logging.debug(f'Batched find on {service} failed ({ex}), using gets')
+            byId = {}
+
+        missing = []
+        for id in ids:
+            record = byId.get(str(id))
+            if record is None:
+                missing.append(id)
+            else:
+                self._settle(service, id, record)
+
+        # The find may have been cut short by the server's paginate.max, and a plain get
+        # gives the server's own error for records that really don't exist
+        await asyncio.gather(*[self._get(service, id) for id in missing])
@@ -0,0 +1,141 @@
+#!python
+
+"""Benchmarks for the receive loop, dispatcher and RPC engine, run against a MockServer
+
+Usage: python -m primus.bench [--events N] [--calls N] [--connections N] [--replay [FILE]] ...
+"""
+
+import argparse
+import asyncio
+import gc
+import logging
+import time
+import tracemalloc
+from .feathers import FeathersClient, serviceEventName
+from .manager import ConnectionManager
+from .mockserver import MockServer, loadCapture
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))] if values else None
+
+
+async def benchEvents(count=10000, payloadSize=4096, subscribed=True, codec='json', replay=None):
+    """Flood one connection with '<service> patched' events, returns events/s handled
+
+    The server closes the connection after the last event, so both the subscribed and
+    unsubscribed runs are timed until the client has worked through every frame.
+    :param replay: Frames to replay (see loadCapture) rather than synthesized events
+    """
+    async with MockServer(eventRate=None, eventCount=count, payloadSize=payloadSize,
+                          pingInterval=None, codec=codec, closeWhenDone=True,
+                          replay=replay) as server:
+        client = FeathersClient(codec=codec)
+        received = 0
+
+        def counter(payload):
+            nonlocal received
+            received += 1
+
+        if subscribed:
+            eventNames = {f['data'][0] for f in replay} if replay else \
+                {serviceEventName(server.service, 'patched')}
+            for eventName in eventNames:
+                client.on(eventName, counter)
+
+        start = time.perf_counter()
+        await asyncio.gather(client.run(server.url), return_exceptions=True)
+        elapsed = time.perf_counter() - start
+        if subscribed and received != count:
+            logging.warning(f'Only {received} of {count} events were handled')
+        return count / elapsed
+
+
+async def benchRpc(calls=5000, concurrency=100, latency=0.0, codec='json'):
+    """Make many get calls (concurrency at a time), returns (calls/s, p50, p99) latencies"""
+    async with MockServer(pingInterval=None, latency=latency, codec=codec) as server:
+        client = FeathersClient(codec=codec)
+        runner = asyncio.ensure_future(client.run(server.url))
+        while client.writer is None:
+            await asyncio.sleep(0.001)
+        ids = list(server.services[server.service])
+        times = []
+
+        async def worker(n):
+            for i in range(n, calls, concurrency):
+                start = time.perf_counter()
+                await client.serverGet(server.service, ids[i % len(ids)])
+                times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker(n) for n in range(concurrency)])
+        elapsed = time.perf_counter() - start
+        client.close()
+        await asyncio.gather(runner, return_exceptions=True)
+        return calls / elapsed, percentile(times, 50), percentile(times, 99)
+
+
+async def benchMemory(connections=100):
+    """Open many connections through a ConnectionManager, returns bytes allocated per connection"""
+    async with MockServer(pingInterval=None) as server:
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        manager = ConnectionManager()
+        for n in range(connections):
+            manager.add(n, FeathersClient(), server.url)
+        runner = asyncio.ensure_future(manager.run())
+        while len(server.connections) < connections:
+            await asyncio.sleep(0.01)
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        manager.close()
+        await asyncio.gather(runner, return_exceptions=True)
+        return used / connections
+
+
+def main():
+    """Run the benchmarks and print a report"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=10000,
+                        help="Number of events to flood the receive loop with")
+    parser.add_argument("--payload", type=int, default=4096,
+                        help="Approximate size of each event payload in bytes")
+    parser.add_argument("--calls", type=int, default=5000,
+                        help="Number of RPC calls to make")
+    parser.add_argument("--concurrency", type=int, default=100,
+                        help="Number of RPC calls to keep in flight")
+    parser.add_argument("--connections", type=int, default=100,
+                        help="Number of connections for the memory benchmark")
+    parser.add_argument("--codec", default="json",
+                        help="The wire parser to use (json or msgpack)")
+    parser.add_argument("--replay", nargs="?", const="", metavar="FILE",
+                        help="Replay the event frames from a websocket capture rather than "
+                             "synthesizing them (without FILE, the traffic captured in the "
+                             "notes in primus.py and feathers.py)")
+    parser.add_argument("--debug", help="Show debug log message",
+                        action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    run = loop.run_until_complete
+
+    replay = None if args.replay is None else loadCapture(args.replay or None)
+    rate = run(benchEvents(args.events, args.payload, codec=args.codec, replay=replay))
+    print(f'events (subscribed):     {rate:10.0f} events/s')
+    rate = run(benchEvents(args.events, args.payload, subscribed=False, codec=args.codec,
+                           replay=replay))
+    print(f'events (unsubscribed):   {rate:10.0f} events/s')
+    rate, p50, p99 = run(benchRpc(args.calls, args.concurrency, codec=args.codec))
+    print(f'rpc:                     {rate:10.0f} calls/s  p50 {p50 * 1000:.2f} ms  p99 {p99 * 1000:.2f} ms')
+    perConnection = run(benchMemory(args.connections))
+    print(f'memory:                  {perConnection / 1024:10.1f} KiB/connection')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import collections
+import json
+import logging
+
+# The field operators matchesQuery understands
+supportedOperators = {'$in', '$nin', '$ne', '$lt', '$lte', '$gt', '$gte'}
+
+
+def canMatchLocally(query):
+    """Return True if matchesQuery can evaluate a query exactly
+
+    Top level $ keys (paging, sorting, $or...), dotted paths into nested records and other
+    operators can't be evaluated here, so results for those queries can't be kept current.
+    """
+    for field, cond in query.items():
+        if field.startswith('$') or '.' in field:
+            return False
+        if isinstance(cond, dict) and not supportedOperators.issuperset(cond):
+            return False
+    return True
+
+
+def matchesQuery(record, query):
+    """Return True if a record matches a (simple) feathers query (see canMatchLocally)"""
+    for field, cond in query.items():
+        value = record.get(field)
+        if isinstance(cond, dict):
+            for op, arg in cond.items():
+                if op == '$in' and value not in arg:
+                    return False
+                if op == '$nin' and value in arg:
+                    return False
+                if op == '$ne' and value == arg:
+                    return False
+                if op in ('$lt', '$lte', '$gt', '$gte'):
+                    if value is None:
+                        return False
+                    try:
+                        if ((op == '$lt' and not value < arg) or (op == '$lte' and not value <= arg) or
+                                (op == '$gt' and not value > arg) or (op == '$gte' and not value >= arg)):
+                            return False
+                    except TypeError:
+                        return False
+        elif value != cond:
+            return False
+    return True
+
+
+class RecordCache:
+    """A size bounded (LRU) cache of service records and find results, kept fresh from the
+    service events the server sends us"""
+
+    def __init__(self, maxRecords=1000, maxQueries=100, idField='_id'):
+        """Constructor
+
+        :param maxRecords: The most records we will keep (least recently used are evicted)
+        :param maxQueries: The most find results we will keep
+        :param idField: The record field that identifies a record
+        """
+        self.maxRecords = maxRecords
+        self.maxQueries = maxQueries
+        self.idField = idField
+        self.records = collections.OrderedDict()  # (service, id) -> record
+        self.queries = collections.OrderedDict()  # (service, query json) -> (query, result)
+        self.seq = 0  # the number of events applied, callers note it before fetching
+        self.changedAt = collections.OrderedDict()  # (service, id) -> seq of its last event
+        self.serviceChangedAt = {}  # service -> seq of its last event
+        self.forgottenAt = 0  # the newest seq dropped from changedAt
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """Return a dict of cache statistics"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'records': len(self.records),
+            'queries': len(self.queries)
+        }
+
+    def _lookup(self, table, key):
+        entry = table.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        table.move_to_end(key)
+        return entry
+
+    def _store(self, table, key, entry, maxSize):
+        table[key] = entry
+        table.move_to_end(key)
+        while len(table) > maxSize:
+            table.popitem(last=False)
+            self.evictions += 1
+
+    @staticmethod
+    def queryKey(service, query):
+        return (service, json.dumps(query, sort_keys=True, default=str))
+
+    def get(self, service, id):
+        """Return a cached record (or None)"""
+        return self._lookup(self.records, (service, id))
+
+    def find(self, service, query):
+        """Return a cached find result (or None)"""
+        entry = self._lookup(self.queries, self.queryKey(service, query))
+        return entry and entry[1]
+
+    def _changedSince(self, key, since):
+        seq = self.changedAt.get(key)
+        if seq is None:
+            return self.forgottenAt > since  # we might have forgotten an event about it
+        return seq > since
+
+    def putRecord(self, service, record, since=None):
+        """Store a record we got from the server
+
+        :param since: The value of seq when the record was requested.  If an event about the
+                      record has arrived since then the reply is older than what the event told
+                      us, so it isn't stored.
+        """
+        id = record.get(self.idField)
+        if id is None or (since is not None and self._changedSince((service, id), since)):
+            return
+        self._store(self.records, (service, id), record, self.maxRecords)
+
+    def putFind(self, service, query, result, since=None):
+        """Store a find result we got from the server (see putRecord for since)"""
+        if since is None or self.serviceChangedAt.get(service, 0) <= since:
+            self._store(self.queries, self.queryKey(service, query),
+                        (query, result), self.maxQueries)
+        for record in (result if isinstance(result, list) else result.get('data', [])):
+            self.putRecord(service, record, since)
+
+    def changed(self, service, record, removed=False):
+        """Apply a created/updated/patched/removed event to the cache"""
+        id = record.get(self.idField)
+        self.seq += 1
+        self.serviceChangedAt[service] = self.seq
+        self.changedAt[(service, id)] = self.seq
+        self.changedAt.move_to_end((service, id))
+        while len(self.changedAt) > self.maxRecords:
+            _, self.forgottenAt = self.changedAt.popitem(last=False)
+        if removed:
+            self.records.pop((service, id), None)
+        elif (service, id) in self.records:
+            self.records[(service, id)] = record
+
+        for key, (query, result) in list(self.queries.items()):
+            if key[0] != service:
+                continue
+            if not isinstance(result, list) or not canMatchLocally(query):
+                # Paginated/sorted results (or queries we can't evaluate) can't be patched up
+                # locally, refetch next time
+                logging.debug(f'Invalidating cached find {key}')
+                del self.queries[key]
+                continue
+            keep = not removed and matchesQuery(record, query)
+            kept = [r for r in result if r.get(self.idField) != id]
+            if keep:
+                pos = next((i for i, r in enumerate(result)
+                            if r.get(self.idField) == id), len(kept))
+                kept.insert(pos, record)
+            self.queries[key] = (query, kept)
+
+    def clear(self):
+        """Forget everything (i.e. when we might have missed events)"""
+        self.records.clear()
+        self.queries.clear()
@@ -0,0 +1,59 @@
+import asyncio
+import logging
+
+
+class Coalescer:
+    """Collapses bursts of events for the same record into a single update
+
+    Events are keyed by record id.  While an update for a record is waiting to be delivered any
+    newer update (patched or updated) for that record replaces it, so handlers only see the
+    latest state, under the latest event name, once per window.
+    """
+
+    def __init__(self, deliver, window=0.1, idField='_id'):
+        """Constructor
+
+        :param deliver: Called as deliver(eventName, payload) to hand on the latest update
+        :param window: Seconds to hold an update before delivering it, or None to hold updates
+                       until drain() is called
+        :param idField: The payload field that identifies a record
+        """
+        self.deliver = deliver
+        self.window = window
+        self.idField = idField
+        self.pending = {}  # id -> (eventName, payload) of the latest update, in arrival order
+        self.timer = None
+
+    def add(self, eventName, payload):
+        """Queue an update (replacing any already queued for this record)
+
+        Payloads without a record id can't be coalesced and are delivered immediately.
+        """
+        id = payload.get(self.idField) if isinstance(payload, dict) else None
+        if id is None:
+            self.deliver(eventName, payload)
+            return
+
+        if id in self.pending:
+            logging.debug(f'Coalescing {eventName} for {id}')
+        # feathers sends whole records, so the newest payload is the whole current state
+        self.pending[id] = (eventName, dict(payload))
+
+        if self.window is not None and self.timer is None:
+            self.timer = asyncio.get_event_loop().call_later(self.window, self.drain)
+
+    def flushRecord(self, id):
+        """Deliver any queued update for a record now (so it isn't reordered with other
+        events about it)"""
+        queued = self.pending.pop(id, None)
+        if queued:
+            self.deliver(*queued)
+
+    def drain(self):
+        """Deliver all queued updates now"""
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        pending, self.pending = self.pending, {}
+        for eventName, payload in pending.values():
+            self.deliver(eventName, payload)
@@ -0,0 +1,88 @@
+import json
+import logging
+from .spill import LazyBlob
+
+
+def defaultLoads():
+    """Pick the fastest JSON decoder that is installed"""
+    for name in ('orjson', 'ujson'):
+        try:
+            return __import__(name).loads
+        except ImportError:
+            pass
+    return json.loads
+
+
+def encodeDefault(obj):
+    """Encode values the encoders don't know about (spilled strings go back on the wire as text)"""
+    if isinstance(obj, LazyBlob):
+        return obj.text
+    raise TypeError(f'Can not encode {type(obj).__name__}')
+
+
+class JsonCodec:
+    """The default primus parser: JSON in text frames"""
+
+    name = 'json'
+    binary = False
+
+    def __init__(self, loads=None):
+        """Constructor
+
+        :param loads: The function used to decode frames, by default the fastest installed
+                      decoder (orjson, ujson or the standard json module)
+        """
+        self.loads = loads or defaultLoads()
+
+    def encode(self, obj):
+        return json.dumps(obj, default=encodeDefault)
+
+    def decode(self, frame):
+        return self.loads(frame)
+
+
+class MsgpackCodec:
+    """MessagePack in binary frames, matching the primus-msgpack server parser
+
+    Needs the msgpack package (pip install primus-python[msgpack]).
+    """
+
+    name = 'msgpack'
+    binary = True
+
+    def __init__(self):
+        """Constructor"""
+        try:
+            import msgpack
+        except ImportError:
+            raise ImportError('The msgpack codec needs the msgpack package installed')
+        self.packer = msgpack.Packer(default=encodeDefault)
+        self.unpackb = msgpack.unpackb
+
+    def encode(self, obj):
+        return self.packer.pack(obj)
+
+    def decode(self, frame):
+        return self.unpackb(frame, raw=False)
+
+
+codecs = {
+    JsonCodec.name: JsonCodec,
+    MsgpackCodec.name: MsgpackCodec
+}
+
+
+def getCodec(codec):
+    """Return a codec given a codec (or codec name)"""
+    if isinstance(codec, str):
+        if codec not in codecs:
+            raise ValueError(f'Unknown codec {codec}')
+        return codecs[codec]()
+    return codec
+
+
+def codecForFrame(frame):
+    """Return a codec matching the kind of frame (text or binary) the server sent"""
+    codec = MsgpackCodec() if isinstance(frame, (bytes, bytearray)) else JsonCodec()
+    logging.info(f'Server is using the {codec.name} parser')
+    return codec
@@ -0,0 +1,80 @@
+import asyncio
+import collections
+import functools
+import logging
+import time
+
+
+class DispatchQueue:
+    """A bounded queue of handler calls for one event, run in order by a worker task
+
+    When the queue is full new calls are either dropped (policy 'drop') or accepted while the
+    receive loop is made to wait for room before reading another frame (policy 'block').
+    """
+
+    def __init__(self, name, maxSize=100, policy='drop', executor=None, onHandled=None):
+        """Constructor
+
+        :param name: The event name (for logging)
+        :param maxSize: The most handler calls we will hold
+        :param policy: 'drop' or 'block'
+        :param executor: If set, plain (non coroutine) handlers are run in this
+                         concurrent.futures executor (thread or process pool) rather than on
+                         the event loop.  Handlers sent to a process pool must be picklable.
+        :param onHandled: If set, called as onHandled(name, seconds) after each handler call
+        """
+        if policy not in ('drop', 'block'):
+            raise ValueError(f'Unknown queue policy {policy}')
+        self.name = name
+        self.maxSize = maxSize
+        self.policy = policy
+        self.executor = executor
+        self.onHandled = onHandled
+        self.items = collections.deque()
+        self.room = asyncio.Event()
+        self.worker = None
+        self.dropped = 0
+
+    def isFull(self):
+        return len(self.items) >= self.maxSize
+
+    def put(self, handler, args):
+        """Queue a call to handler(*args)"""
+        if self.isFull() and self.policy == 'drop':
+            self.dropped += 1
+            logging.warning(f'Dispatch queue for {self.name} full, dropping event')
+            return
+        self.items.append((handler, args))
+        if self.isFull():
+            self.room.clear()
+        if self.worker is None:
+            self.worker = asyncio.ensure_future(self._run())
+
+    async def waitForRoom(self):
+        """Wait until the queue has space for another call"""
+        while self.isFull():
+            await self.room.wait()
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        try:
+            while self.items:
+                handler, args = self.items.popleft()
+                if not self.isFull():
+                    self.room.set()
+                start = time.perf_counter()
+                try:
+                    if asyncio.iscoroutinefunction(handler):
+                        await handler(*args)
+                    elif self.executor:
+                        await loop.run_in_executor(self.executor, functools.partial(handler, *args))
+                    else:
+                        r = handler(*args)
+                        if asyncio.iscoroutine(r):
+                            await r
+                except Exception:
+                    logging.exception(f'Handler for {self.name} failed')
+                if self.onHandled:
+                    self.onHandled(self.name, time.perf_counter() - start)
+        finally:
+            self.worker = None
@@ -1,15 +1,55 @@
-
 from .primus import PrimusClient
+from .coalesce import Coalescer
+from .cache import RecordCache
+from .batch import GetBatcher
+from .spill import Spiller
+from .writer import PRIORITY_AUTH, PRIORITY_NORMAL
+import asyncio
 import logging
+import re
+import time
+
+# The header of an event frame, i.e. {"type":0,"data":["ezdevs patched",...
+eventHeaderPattern = re.compile(r'\{"type":\s*0,\s*"data":\s*\["([^"\\]*)"')
+
+
+class FeathersError(Exception):
+    """An error returned by the server in response to a function call"""
+
+    def __init__(self, err):
+        """Constructor
+
+        :param err: The error object sent by the server, a dict with (usually) ``name``,
+                    ``message``, ``code`` and ``data`` entries
+        """
+        self.err = err
+        self.name = err.get('name')
+        self.code = err.get('code')
+        super().__init__(f'Error returned from server {err.get("message")}')
 
 
 class FeathersClient(PrimusClient):
     """Client nub for talking to feathers servers"""
 
-    def __init__(self):
-        """Constructor"""
-        super().__init__()
-        self.pendingCalls = {}  # a dict from callid to the promise
+    def __init__(self, callTimeout=30.0, maxInFlight=256, **kwargs):
+        """Constructor
+
+        :param callTimeout: Default number of seconds to wait for a function result
+                            (None to wait forever)
+        :param maxInFlight: The most calls we will have outstanding on the wire at once, callers
+                            beyond this wait in serverAsync until an earlier call completes
+        Other keyword arguments are passed to PrimusClient.
+        """
+        super().__init__(**kwargs)
+        self.callid = 0
+        self.callTimeout = callTimeout
+        self.pendingCalls = {}  # a dict from callid to the future for its result
+        self.callWindow = asyncio.Semaphore(maxInFlight)
+        self.coalescers = {}  # a dict from service name to (coalescer, methods)
+        self.cache = None  # an optional RecordCache, see enableCache()
+        self.cachedServices = set()  # services whose events we are applying to the cache
+        self.batcher = None  # an optional GetBatcher, see enableBatching()
+        self.spiller = None  # an optional Spiller for event payloads, see spillBlobs()
 
         # We convert raw messages into standard socket.io events, published using the name of event
         @self.on('message')
@@ -21,56 +61,246 @@ class FeathersClient(PrimusClient):
                 eventName = data[0]
                 payload = data[1]
                 logging.debug(f'Handling event: {eventName}')
-                self.call_handler(eventName, payload)
+                if self.spiller and isinstance(payload, dict):
+                    self.spiller.spill(payload)
+                service, _, method = eventName.partition(' ')
+                coalescer, methods = self.coalescers.get(service, (None, ()))
+                if method in methods:
+                    coalescer.add(eventName, payload)
+                else:
+                    if coalescer and isinstance(payload, dict):
+                        coalescer.flushRecord(payload.get(coalescer.idField))
+                    self.call_handler(eventName, payload)
             elif typ == 1:
                 # A function result
                 id = msg['id']
                 data = msg['data']
+                future = self.pendingCalls.get(id)
+                if future is None or future.done():
+                    # The caller gave up (timeout or cancel) before the server answered
+                    logging.debug(f'Ignoring result for abandoned call {id}')
+                    return
                 err = data[0]  # or None for success
                 if err:
-                    raise Exception(
-                        f'Error returned from server {err.message}')
-                result = data[1]  # only valid if !err
-                logging.info(f'FIXME ignoring function result {result}')
+                    future.set_exception(FeathersError(err))
+                else:
+                    future.set_result(data[1] if len(data) > 1 else None)
             else:
                 raise Exception('Unexpected message type')
 
-    def serverAsync(self, *args):
-        """Call a function on our server (and return the ID of that call)"""
+        @self.on('disconnect')
+        def disconnect_handler():
+            self.drainCoalesced()
+            if self.cache:
+                self.cache.clear()  # we won't hear about changes while disconnected
+            for future in list(self.pendingCalls.values()):
+                if not future.done():
+                    future.set_exception(
+                        ConnectionError('Connection closed before server replied'))
+
+    def wantsFrame(self, msg):
+        """Skip decoding event frames for events no one has subscribed to"""
+        header = eventHeaderPattern.match(msg) if isinstance(msg, str) else None
+        if header:
+            return self.hasHandler(header.group(1))
+        return True  # function results and anything we can't peek at are always decoded
+
+    def coalesce(self, service, methods=('patched', 'updated'), window=0.1):
+        """Merge bursts of events about the same record of a service into one update
+
+        Rather than dispatching every event for a record, only the latest state is
+        delivered once per window.  With window=None updates are held until drainCoalesced()
+        is called.  Other events about a record (i.e. removed) flush its queued update first.
+        """
+        coalescer = Coalescer(self.call_handler, window)
+        self.coalescers[service] = (coalescer, methods)
+        return coalescer
+
+    def drainCoalesced(self):
+        """Deliver any updates currently held for coalescing"""
+        for coalescer, methods in self.coalescers.values():
+            coalescer.drain()
+
+    def spillBlobs(self, paths=(), threshold=None, area=None):
+        """Keep large string values in event payloads off the python heap
+
+        The named values (dotted paths such as ``'debugImage'`` or ``'display.html'``), and if
+        threshold is set any string at least that long, are replaced by LazyBlob references
+        into a memory mapped SpillArea.  Identical values are stored once.  Records returned by
+        serverGet/serverFind are spilled the same way, so they look alike whether they came
+        from an event or a call (and from the cache or not).
+        """
+        self.spiller = Spiller(paths, threshold, area)
+        return self.spiller
+
+    def enableMetrics(self):
+        """Start collecting metrics, including RPC latency and the pending call count"""
+        metrics = super().enableMetrics()
+        metrics.gauges['pendingCalls'] = lambda: len(self.pendingCalls)
+        return metrics
+
+    def enableCache(self, maxRecords=1000, maxQueries=100):
+        """Serve serverGet/serverFind calls from a local cache kept current by service events
+
+        Only calls without options are cached.  Cached records are shared, callers must not
+        modify them.  Returns the RecordCache (see RecordCache.stats() for hit/miss counts).
+        """
+        self.cache = RecordCache(maxRecords, maxQueries)
+        return self.cache
+
+    def enableBatching(self, window=0.0, maxBatch=50):
+        """Merge concurrent serverGet calls (without options) into batched finds
+
+        Concurrent gets of the same record share one request, and distinct ids requested
+        within window seconds are fetched with one find using an $in query.
+        """
+        self.batcher = GetBatcher(self, window, maxBatch)
+        return self.batcher
+
+    def _watchService(self, service):
+        """Start applying a service's events to our cache"""
+        if service in self.cachedServices:
+            return
+        self.cachedServices.add(service)
+        for method in ('created', 'updated', 'patched', 'removed'):
+            removed = method == 'removed'
+            self.on(serviceEventName(service, method),
+                    lambda record, removed=removed: self.cache.changed(service, record, removed))
+
+    async def serverAsync(self, *args, timeout=None):
+        """Call a function on our server (and return a future for the result of that call)
+
+        Any number of calls can be outstanding at once (up to maxInFlight), results are matched
+        back to their callers by call id.  The future fails with asyncio.TimeoutError if the server
+        has not replied within timeout (or callTimeout) seconds.  Authentication calls skip the
+        maxInFlight window and are sent ahead of other calls.
+        """
+        isAuth = bool(args) and args[0] == 'authenticate'
+        if not isAuth:
+            await self.callWindow.acquire()
         self.callid = self.callid + 1
+        id = self.callid
         msg = {
-            'id': self.callid,
+            'id': id,
             'type': 0,
             'data': args
         }
-        logging.info(f'calling server function {msg}')
-        self.ws.emit(json.dumps(msg))
-        self.pendingCalls[msg.id] = "FIXME-need something to wait on"
-        return msg.id
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self.pendingCalls[id] = future
+
+        timeout = self.callTimeout if timeout is None else timeout
+        expiry = loop.call_later(
+            timeout, self._expireCall, id) if timeout else None
+
+        start = time.perf_counter()
+
+        def call_done(f):
+            # Runs however the call finished (result, error, timeout or the caller cancelling)
+            if self.metrics:
+                service = args[1] if len(args) > 1 and isinstance(args[1], str) else None
+                self.metrics.rpc(service, args[0], time.perf_counter() - start)
+            self.pendingCalls.pop(id, None)
+            if not isAuth:
+                self.callWindow.release()
+            if expiry:
+                expiry.cancel()
+
+        future.add_done_callback(call_done)
+
+        logging.debug('calling server function %s', msg)
+        try:
+            # Passing our future means we stop waiting for room to send if the call times out
+            await self.sendObject(msg, PRIORITY_AUTH if isAuth else PRIORITY_NORMAL, future)
+        except Exception as ex:
+            if not future.done():
+                future.set_exception(ex)
+        except BaseException:
+            # Cancelled while waiting to send, the frame was never queued
+            future.cancel()
+            raise
+        return future
+
+    def _expireCall(self, id):
+        """Fail a call the server never answered"""
+        future = self.pendingCalls.get(id)
+        if future and not future.done():
+            future.set_exception(asyncio.TimeoutError(
+                f'No reply from server for call {id}'))
 
-    def serverSync(self, *args):
-        """Call a function on the server and then wait for a response"""
-        id = self.serverAsync(*args)
+    async def serverCall(self, *args, timeout=None):
+        """Call a function on the server and wait for its result"""
+        return await (await self.serverAsync(*args, timeout=timeout))
 
-    def serverGet(self, service, id, options={}):
+    def serverSync(self, *args, timeout=None):
+        """Call a function on the server and then wait for a response
+
+        This is for use from threads other than the one running our event loop, coroutines
+        should await serverCall instead.
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self.serverCall(*args, timeout=timeout), self.loop).result()
+
+    async def serverGet(self, service, id, options={}):
         """Get a record from a feathers service"""
-        return self.serverSync(service, 'get', id, options)
+        if options:
+            return self._spillRecord(await self.serverCall('get', service, id, options))
+
+        if self.cache:
+            record = self.cache.get(service, id)
+            if record is not None:
+                return record
+            self._watchService(service)
+            since = self.cache.seq  # so a reply that raced with an event isn't cached
+
+        if self.batcher:
+            # Shielded, so a caller giving up doesn't cancel the request for everyone sharing it
+            record = await asyncio.shield(self.batcher.get(service, id))
+        else:
+            record = await self.serverCall('get', service, id, options)
+
+        self._spillRecord(record)
+        if self.cache:
+            self.cache.putRecord(service, record, since)
+        return record
 
-    def serverUpdate(self, service, id, payload, options={}):
+    async def serverUpdate(self, service, id, payload, options={}):
         """Update a record on a feathers service"""
-        return self.serverSync(service, 'update', id, payload, options)
+        return await self.serverCall('update', service, id, payload, options)
 
-    def serverPatch(self, service, id, payload, options={}):
+    async def serverPatch(self, service, id, payload, options={}):
         """Patch a record on a feathers service"""
-        return self.serverSync(service, 'patch', id, payload, options)
+        return await self.serverCall('patch', service, id, payload, options)
 
-    def serverRemove(self, service, id, options={}):
+    async def serverRemove(self, service, id, options={}):
         """Remove a record from a feathers service"""
-        return self.serverSync(service, 'remove', id, options)
+        return await self.serverCall('remove', service, id, options)
 
-    def serverFind(self, service, query, options={}):
+    async def serverFind(self, service, query, options={}):
         """Find records from a feathers service"""
-        return self.serverSync(service, 'find', query, options)
+        if self.cache is None or options:
+            return self._spillFound(await self.serverCall('find', service, query, options))
+
+        result = self.cache.find(service, query)
+        if result is None:
+            self._watchService(service)
+            since = self.cache.seq
+            result = self._spillFound(await self.serverCall('find', service, query, options))
+            self.cache.putFind(service, query, result, since)
+        return result
+
+    def _spillRecord(self, record):
+        """Spill the large values of a record we got from the server (see spillBlobs)"""
+        if self.spiller and isinstance(record, dict):
+            self.spiller.spill(record)
+        return record
+
+    def _spillFound(self, result):
+        """Spill the records of a find result (plain or paginated)"""
+        if self.spiller:
+            for record in (result if isinstance(result, list) else result.get('data', [])):
+                self._spillRecord(record)
+        return result
 
 
 def serviceEventName(service, method="patched"):
@@ -87,7 +317,6 @@ class EZDeviceFeathers(FeathersClient):
     def __init__(self):
         """Constructor"""
         super().__init__()
-        self.callid = 0
 
         @self.on(serviceEventName('ezdevs', f'event:{appName}'))
         def devevent_handler(msg):
@@ -95,10 +324,6 @@ class EZDeviceFeathers(FeathersClient):
             name = msg["name"]
             self.call_handler('devevent', id, name)
 
-        @self.on(serviceEventName('ezdevs', 'patched'))
-        def patch_handler(msg):
-            logging.debug('ignoring patch on dev')
-
 
 """
 See https://docs.feathersjs.com/api/client/primus.html#direct-connection
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import multiprocessing
+
+
+class ConnectionManager:
+    """Runs many primus/feathers connections on one event loop
+
+    Each connection is a PrimusClient (or subclass) talking to its own server (or with its own
+    credentials).  Handlers registered on the manager are registered on every connection it
+    manages (including ones added later) and are called with the client as their first
+    argument, followed by the usual event arguments.
+    """
+
+    def __init__(self, reconnectDelay=None):
+        """Constructor
+
+        :param reconnectDelay: If set, seconds to wait before reconnecting a connection that
+                               closed or failed, otherwise it is left closed
+        """
+        self.reconnectDelay = reconnectDelay
+        self.clients = {}  # a dict from connection name to (client, server)
+        self.tasks = {}  # a dict from connection name to the task running it
+        self.handlers = []  # (event, handler) pairs to register on every client
+        self.running = False
+
+    def on(self, event, handler=None):
+        """Register a handler for an event on every connection (see EventPublisher.on)"""
+        def set_handler(handler):
+            self.handlers.append((event, handler))
+            for client, server in self.clients.values():
+                self._register(client, event, handler)
+            return handler
+
+        if handler is None:
+            return set_handler
+        set_handler(handler)
+
+    def _register(self, client, event, handler):
+        if asyncio.iscoroutinefunction(handler):
+            # Keep it a coroutine function, so dispatch queues await it rather than sending it
+            # to an executor
+            async def wrapper(*args):
+                await handler(client, *args)
+        else:
+            def wrapper(*args):
+                return handler(client, *args)
+        client.on(event, wrapper)
+
+    def add(self, name, client, server):
+        """Add a connection, it is started immediately if the manager is running"""
+        if name in self.clients:
+            raise ValueError(f'Duplicate connection name {name}')
+        self.clients[name] = (client, server)
+        for event, handler in self.handlers:
+            self._register(client, event, handler)
+        if self.running:
+            self._start(name)
+        return client
+
+    def remove(self, name):
+        """Close a connection and stop managing it"""
+        client, server = self.clients.pop(name)
+        task = self.tasks.pop(name, None)
+        if task:
+            task.cancel()
+        return client
+
+    def _start(self, name):
+        self.tasks[name] = asyncio.ensure_future(self._runOne(name))
+
+    async def _runOne(self, name):
+        try:
+            while name in self.clients:
+                client, server = self.clients[name]
+                try:
+                    await client.run(server)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as ex:
+                    logging.error(f'Connection {name} to {server} failed: {ex}')
+                if self.reconnectDelay is None:
+                    break
+                await asyncio.sleep(self.reconnectDelay)
+        finally:
+            self.tasks.pop(name, None)
+
+    async def run(self):
+        """Run all our connections until they have all closed"""
+        self.running = True
+        try:
+            for name in self.clients:
+                self._start(name)
+            while self.tasks:
+                await asyncio.wait(list(self.tasks.values()))
+        finally:
+            self.running = False
+
+    def close(self):
+        """Close all our connections"""
+        for task in list(self.tasks.values()):
+            task.cancel()
+
+
+def _runShard(factory, setup, servers, reconnectDelay):
+    # Set up our loop first, the clients create asyncio objects that bind to it
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    manager = ConnectionManager(reconnectDelay)
+    for name, server in servers:
+        manager.add(name, factory(name), server)
+    if setup:
+        setup(manager)
+    loop.run_until_complete(manager.run())
+
+
+def runSharded(factory, servers, processes=None, setup=None, reconnectDelay=None):
+    """Spread connections over worker processes, each running a ConnectionManager on its own loop
+
+    :param factory: Called as factory(name) in the worker to build the client for a connection
+    :param servers: A dict from connection name to server url
+    :param processes: The number of worker processes (default one per cpu)
+    :param setup: Called as setup(manager) in each worker, to register handlers
+    The factory and setup functions must be picklable (i.e. module level functions).
+    Blocks until every worker has exited.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    items = sorted(servers.items())
+    shards = [items[i::processes] for i in range(processes)]
+    workers = [multiprocessing.Process(target=_runShard, args=(factory, setup, shard, reconnectDelay))
+               for shard in shards if shard]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
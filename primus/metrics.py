@@ -0,0 +1,165 @@
+import asyncio
+import bisect
+import logging
+import time
+
+# Histogram bucket upper bounds in seconds: 1us to ~2 minutes in steps of sqrt(2)
+bucketBounds = [1e-6 * 2 ** (i / 2) for i in range(54)]
+
+
+def frameBytes(msg):
+    """Return the size in bytes of a frame as sent on the wire (text frames are utf-8)"""
+    if isinstance(msg, str) and not msg.isascii():
+        return len(msg.encode('utf-8'))
+    return len(msg)
+
+
+class Histogram:
+    """A fixed bucket (log scale) histogram, cheap enough to update on every call"""
+
+    def __init__(self):
+        """Constructor"""
+        self.counts = [0] * (len(bucketBounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        self.counts[bisect.bisect_left(bucketBounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """Return (the upper bound of the bucket holding) the p'th percentile, or None if empty"""
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(bucketBounds[i], self.max) if i < len(bucketBounds) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'max': self.max
+        }
+
+
+class Metrics:
+    """Counters and latency histograms for a connection's receive, dispatch and RPC paths
+
+    Times are in seconds.  Read them with snapshot(), or have a snapshot passed to a callback
+    every so often with startReporting().
+    """
+
+    def __init__(self):
+        """Constructor"""
+        self.framesIn = 0
+        self.bytesIn = 0
+        self.framesOut = 0
+        self.bytesOut = 0
+        self.skipped = 0  # frames we didn't bother decoding
+        self.decodeTime = Histogram()
+        self.dispatchCounts = {}  # event name -> number of handler calls
+        self.handlerTime = {}  # event name -> Histogram
+        self.rpcTime = {}  # (service or None, method) -> Histogram
+        self.heartbeatDelay = Histogram()
+        self.gauges = {}  # name -> function returning the current value
+        self.lastSnapshot = self._counters()  # the baseline for snapshot()'s rates
+        self.reporter = None
+
+    def frameIn(self, msg):
+        self.framesIn += 1
+        self.bytesIn += frameBytes(msg)
+
+    def frameOut(self, msg):
+        self.framesOut += 1
+        self.bytesOut += frameBytes(msg)
+
+    def handled(self, event, elapsed):
+        self.dispatchCounts[event] = self.dispatchCounts.get(event, 0) + 1
+        h = self.handlerTime.get(event)
+        if h is None:
+            h = self.handlerTime[event] = Histogram()
+        h.record(elapsed)
+
+    def rpc(self, service, method, elapsed):
+        key = (service, method)
+        h = self.rpcTime.get(key)
+        if h is None:
+            h = self.rpcTime[key] = Histogram()
+        h.record(elapsed)
+
+    def ping(self, timestamp):
+        """Record a primus::ping::<timestamp> heartbeat
+
+        The server's timestamp (in ms) is compared with our clock, so the delay includes any
+        clock skew between us and the server as well as the network delay.
+        """
+        try:
+            self.heartbeatDelay.record(max(0.0, time.time() - int(timestamp) / 1000.0))
+        except ValueError:
+            pass
+
+    def _counters(self):
+        return (time.monotonic(), self.framesIn, self.bytesIn, self.framesOut, self.bytesOut)
+
+    def snapshot(self):
+        """Return a dict of the current metrics (rates are since the previous snapshot() call)
+
+        The reporting started by startReporting() keeps its own baseline, so it doesn't skew
+        the rates seen by callers of snapshot() (or the other way round).
+        """
+        snapshot, self.lastSnapshot = self._snapshot(self.lastSnapshot)
+        return snapshot
+
+    def _snapshot(self, baseline):
+        """Return (the metrics with rates since baseline, the new baseline)"""
+        counters = self._counters()
+        then, framesIn, bytesIn, framesOut, bytesOut = baseline
+        elapsed = max(counters[0] - then, 1e-9)
+        return {
+            'framesIn': self.framesIn,
+            'bytesIn': self.bytesIn,
+            'framesOut': self.framesOut,
+            'bytesOut': self.bytesOut,
+            'skippedFrames': self.skipped,
+            'framesInPerSec': (self.framesIn - framesIn) / elapsed,
+            'bytesInPerSec': (self.bytesIn - bytesIn) / elapsed,
+            'framesOutPerSec': (self.framesOut - framesOut) / elapsed,
+            'bytesOutPerSec': (self.bytesOut - bytesOut) / elapsed,
+            'decodeTime': self.decodeTime.summary(),
+            'dispatchCounts': dict(self.dispatchCounts),
+            'handlerTime': {k: h.summary() for k, h in self.handlerTime.items()},
+            'rpcTime': {f'{s} {m}' if s else m: h.summary() for (s, m), h in self.rpcTime.items()},
+            'heartbeatDelay': self.heartbeatDelay.summary(),
+            **{name: gauge() for name, gauge in self.gauges.items()}
+        }, counters
+
+    def startReporting(self, callback, interval=60.0):
+        """Call callback(snapshot) every interval seconds (until stopReporting)"""
+        async def report(baseline):
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    snapshot, baseline = self._snapshot(baseline)
+                    callback(snapshot)
+                except Exception:
+                    logging.exception('Metrics callback failed')
+
+        self.stopReporting()
+        self.reporter = asyncio.ensure_future(report(self._counters()))
+
+    def stopReporting(self):
+        if self.reporter:
+            self.reporter.cancel()
+            self.reporter = None
@@ -0,0 +1,294 @@
+"""An in process stand in for a primus/feathers server, for tests and benchmarks
+
+It speaks the primus heartbeat and the feathers call/result/event framing (see the captured
+traffic in feathers.py) and can synthesize or replay event traffic at a configurable rate.
+"""
+
+import asyncio
+import base64
+import copy
+import itertools
+import json
+import logging
+import os
+import time
+import websockets
+from .codec import getCodec
+
+
+def dumps(obj):
+    """Encode a frame the way feathers does (compact, no spaces)"""
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def loadCapture(paths=None):
+    """Load the event frames from a capture of websocket traffic
+
+    The capture is text as copied from a browser's websocket inspector: one frame per line
+    (optionally prefixed with 'up' or 'down', and followed by a tab and the frame size), see the
+    notes at the end of primus.py and feathers.py.  Only server to client event frames are kept.
+
+    :param paths: The capture files to read, by default the traffic captured in those notes
+    :return: A list of decoded frames, suitable for MockServer(replay=...)
+    """
+    if paths is None:
+        here = os.path.dirname(__file__)
+        paths = [os.path.join(here, 'primus.py'), os.path.join(here, 'feathers.py')]
+    elif isinstance(paths, str):
+        paths = [paths]
+
+    frames = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                direction, sep, rest = line.partition(' ')
+                if direction.rstrip(':') in ('up', 'down'):
+                    if direction.startswith('up'):
+                        continue
+                    line = rest
+                try:
+                    frame = json.loads(line.split('\t')[0])
+                except ValueError:
+                    continue  # not a frame (timestamps, notes, truncated frames...)
+                if isinstance(frame, dict) and frame.get('type') == 0 and \
+                        isinstance(frame.get('data'), list) and ' ' in str(frame['data'][0]):
+                    frames.append(frame)
+    return frames
+
+
+def sampleDevice(id, payloadSize=4096):
+    """Build a device record shaped like the 'ezdevs patched' documents we see from ezdevice"""
+    now = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
+    return {
+        '_id': id,
+        'application': 'joyframe',
+        'createdAt': now,
+        'updatedAt': now,
+        'status': 'online',
+        'firmwareVersion': 'V0.1.7-34',
+        'firmwareNum': 34,
+        'display': {
+            'html': '<html><body><p>Q: How many surrealists does it take to change a light bulb?'
+                    '<p>A: To get to the other side.</body></html>',
+            'options': {'allowDithering': False},
+            'mode': 'forever'
+        },
+        'debugImage': 'data:image/png;base64,' +
+                      base64.b64encode(os.urandom(payloadSize * 3 // 4)).decode('ascii')
+    }
+
+
+class MockServer:
+    """A local primus/feathers server
+
+    Services are in memory dicts of records (keyed by _id).  get/find/create/update/patch/remove
+    and authenticate calls are supported, and mutations are broadcast as service events like a
+    real feathers server would.
+    """
+
+    def __init__(self, pingInterval=30.0, eventRate=0, eventCount=None, payloadSize=4096,
+                 service='ezdevs', records=10, replay=None, latency=0.0, compression=None,
+                 codec='json', closeWhenDone=False):
+        """Constructor
+
+        :param pingInterval: Seconds between primus::ping heartbeats (None for no heartbeats)
+        :param eventRate: Synthesized '<service> patched' events per second sent to each
+                          connection (0 for none, None for as fast as possible)
+        :param eventCount: Stop synthesizing events after this many per connection
+        :param payloadSize: The approximate size in bytes of the debugImage in each record
+        :param service: The service the synthesized records belong to
+        :param records: The number of records in that service
+        :param replay: Frames to send over and over (at eventRate) instead of synthesized
+                       events, either raw (already encoded) frames or frame objects such as
+                       those from loadCapture() (which are encoded with our codec)
+        :param latency: Seconds to wait before answering each call
+        :param compression: Passed to websockets.serve, 'deflate' to offer permessage-deflate
+                            (off by default so benchmarks measure the client, not zlib)
+        :param codec: The primus parser to speak, 'json' or 'msgpack'
+        :param closeWhenDone: Close each connection once its eventCount events have been sent
+        """
+        self.pingInterval = pingInterval
+        self.eventRate = eventRate
+        self.eventCount = eventCount
+        self.service = service
+        self.latency = latency
+        self.compression = compression
+        self.codec = getCodec(codec)
+        self.closeWhenDone = closeWhenDone
+        self.encode = dumps if self.codec.name == 'json' else self.codec.encode
+        self.replay = replay and [f if isinstance(f, (str, bytes)) else self.encode(f)
+                                  for f in replay]
+        self.services = {service: {}}
+        for i in range(records):
+            id = f'JTB4E62DEA{i:04X}'
+            self.services[service][id] = sampleDevice(id, payloadSize)
+        self.connections = set()
+        self.pongs = []  # the timestamps of the pongs we have received
+        self.calls = []  # the (method, service) of each call we have handled
+        self.server = None
+        self.url = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Start listening, returns the url clients should connect to"""
+        self.server = await websockets.serve(self._serve, host, port, compression=self.compression)
+        port = self.server.sockets[0].getsockname()[1]
+        self.url = f'ws://{host}:{port}/primus'
+        return self.url
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def broadcast(self, frame):
+        """Send a raw frame to every connected client"""
+        for ws in list(self.connections):
+            try:
+                await ws.send(frame)
+            except websockets.ConnectionClosed:
+                pass
+
+    async def emit(self, eventName, payload):
+        """Send a feathers event to every connected client"""
+        await self.broadcast(self.encode({'type': 0, 'data': [eventName, payload]}))
+
+    async def _serve(self, ws, path=None):
+        self.connections.add(ws)
+        tasks = []
+        if self.pingInterval:
+            tasks.append(asyncio.ensure_future(self._heartbeat(ws)))
+        if self.eventRate != 0:
+            tasks.append(asyncio.ensure_future(self._events(ws)))
+        try:
+            async for msg in ws:
+                await self._received(ws, msg)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.connections.discard(ws)
+            for t in tasks:
+                t.cancel()
+
+    async def _heartbeat(self, ws):
+        while True:
+            await asyncio.sleep(self.pingInterval)
+            await ws.send(self.encode(f'primus::ping::{int(time.time() * 1000)}'))
+
+    def _frames(self):
+        """Generate the event frames we send to each connection"""
+        if self.replay:
+            yield from itertools.cycle(self.replay)
+        records = self.services[self.service]
+        for n in itertools.count():
+            record = dict(list(records.values())[n % len(records)])
+            record['updatedAt'] = time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
+            yield self.encode({'type': 0, 'data': [f'{self.service} patched', record]})
+
+    async def _events(self, ws):
+        await self._sendEvents(ws)
+        if self.closeWhenDone:
+            await ws.close()
+
+    async def _sendEvents(self, ws):
+        frames = self._frames()
+        if self.eventCount is not None:
+            frames = itertools.islice(frames, self.eventCount)
+        if self.eventRate is None:
+            for frame in frames:
+                await ws.send(frame)
+            return
+
+        # Send in small bursts so high rates aren't limited by timer resolution
+        tick = 0.01
+        owed = 0.0
+        while True:
+            owed += self.eventRate * tick
+            while owed >= 1:
+                owed -= 1
+                frame = next(frames, None)
+                if frame is None:
+                    return
+                await ws.send(frame)
+            await asyncio.sleep(tick)
+
+    async def _received(self, ws, msg):
+        call = self.codec.decode(msg)
+        if isinstance(call, str) and call.startswith('primus::pong::'):
+            self.pongs.append(call[len('primus::pong::'):])
+            return
+        asyncio.ensure_future(self._answer(ws, call))
+
+    async def _answer(self, ws, call):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        id = call.get('id')
+        try:
+            result = await self._call(*call['data'])
+            reply = [None, result]
+        except KeyError as ex:
+            reply = [{'name': 'NotFound', 'message': f'No record found for id {ex}',
+                      'code': 404, 'className': 'not-found', 'data': {}, 'errors': {}}]
+        except Exception as ex:
+            logging.exception('Mock call failed')
+            reply = [{'name': 'GeneralError', 'message': str(ex), 'code': 500,
+                      'className': 'general-error', 'data': {}, 'errors': {}}]
+        try:
+            await ws.send(self.encode({'id': id, 'type': 1, 'data': reply}))
+        except websockets.ConnectionClosed:
+            pass
+
+    async def _call(self, method, *args):
+        if method == 'authenticate':
+            self.calls.append((method, None))
+            return {'accessToken': 'mock-token'}
+
+        service, args = args[0], args[1:]
+        self.calls.append((method, service))
+        records = self.services.setdefault(service, {})
+        if method == 'get':
+            return records[args[0]]
+        if method == 'find':
+            query = dict(args[0] or {})
+            limit = query.pop('$limit', None)
+            for key in [k for k in query if k.startswith('$')]:
+                del query[key]
+            found = [r for r in records.values() if self._matches(r, query)]
+            return found[:limit] if limit is not None else found
+        if method == 'create':
+            record = dict(args[0])
+            record.setdefault('_id', f'{len(records):x}')
+            records[record['_id']] = record
+            await self.emit(f'{service} created', record)
+            return record
+        if method == 'update':
+            record = dict(args[1], _id=args[0])
+            records[args[0]] = record
+            await self.emit(f'{service} updated', record)
+            return record
+        if method == 'patch':
+            record = copy.copy(records[args[0]])
+            record.update(args[1])
+            records[args[0]] = record
+            await self.emit(f'{service} patched', record)
+            return record
+        if method == 'remove':
+            record = records.pop(args[0])
+            await self.emit(f'{service} removed', record)
+            return record
+        raise ValueError(f'Unsupported method {method}')
+
+    @staticmethod
+    def _matches(record, query):
+        for field, cond in query.items():
+            if isinstance(cond, dict) and '$in' in cond:
+                if record.get(field) not in cond['$in']:
+                    return False
+            elif record.get(field) != cond:
+                return False
+        return True
@@ -1,11 +1,14 @@
-
-
+from .dispatch import DispatchQueue
+from .writer import FrameWriter, PRIORITY_HEARTBEAT, PRIORITY_NORMAL, waitUnlessDone
+from .metrics import Metrics
+from .codec import JsonCodec, getCodec, codecForFrame
 import logging
+import time
 import websockets
 import asyncio
 import re
-import json
 
+pingPrefix = '"primus::ping::'
 pingPattern = re.compile("\"primus::ping::(.+)\"")
 
 
@@ -14,7 +17,10 @@ class EventPublisher:
 
     def __init__(self):
         """Constructor"""
-        self.handlers = {}
+        self.handlers = {}  # a dict from event name to a list of handlers
+        self.queues = {}  # a dict from event name to the DispatchQueue for that event (if routed)
+        self.tasks = set()  # coroutine handlers that are still running
+        self.metrics = None  # an optional Metrics, see enableMetrics()
 
     def on(self, event, handler=None):
         """Register an event handler.
@@ -40,55 +46,236 @@ class EventPublisher:
         handler will be passed to the client's acknowledgement callback
         function if it exists. The ``'disconnect'`` handler does not take
         arguments.
+        Any number of handlers can be registered for an event, they are called in the order
+        they were registered.  Handlers can be ``async def`` coroutines, these are run as tasks
+        so they don't hold up the connection.
         """
         def set_handler(handler):
             logging.info(f'registering handler for {event}')
-            self.handlers[event] = handler
+            self.handlers.setdefault(event, []).append(handler)
             return handler
 
         if handler is None:
             return set_handler
         set_handler(handler)
 
-    def call_handler(self, name, *args):
-        """Call a particular handler name"""
-        h = self.handlers.get(name)
-        if h:
-            h(*args)
+    def off(self, event, handler=None):
+        """Unregister a handler (or all handlers if handler is None) for an event"""
+        if handler is None:
+            self.handlers.pop(event, None)
         else:
-            logging.info(f'No handler registered for {name} msg={ args }')
+            self.handlers.get(event, []).remove(handler)
+
+    def route(self, event, maxSize=100, policy='drop', executor=None):
+        """Run the handlers for an event from a bounded queue rather than inline
+
+        :param maxSize: The most calls we will hold for the event
+        :param policy: What to do when the queue is full: 'drop' discards the event, 'block'
+                       stops reading from the server until the handlers catch up
+        :param executor: An optional concurrent.futures thread or process pool to run (non
+                         coroutine) handlers in, so slow handlers don't stall the event loop
+        """
+        self.queues[event] = DispatchQueue(event, maxSize, policy, executor, self._handled)
+
+    def call_handler(self, name, *args):
+        """Call the handlers for a particular event name"""
+        handlers = self.handlers.get(name)
+        if not handlers:
+            logging.info('No handler registered for %s msg=%s', name, args)
+            return
+
+        queue = self.queues.get(name)
+        for h in handlers:
+            if queue:
+                queue.put(h, args)
+            else:
+                start = time.perf_counter() if self.metrics else None
+                r = h(*args)
+                if asyncio.iscoroutine(r):
+                    task = asyncio.ensure_future(r)
+                    self.tasks.add(task)
+                    task.add_done_callback(
+                        lambda task, start=start: self._handlerDone(task, name, start))
+                elif start is not None:
+                    self._handled(name, time.perf_counter() - start)
+
+    def _handlerDone(self, task, name, start):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logging.error('Event handler failed', exc_info=task.exception())
+        if start is not None:
+            self._handled(name, time.perf_counter() - start)
+
+    def _handled(self, name, elapsed):
+        if self.metrics:
+            self.metrics.handled(name, elapsed)
+
+    def enableMetrics(self):
+        """Start collecting metrics (see Metrics.snapshot), returns the Metrics"""
+        if self.metrics is None:
+            self.metrics = Metrics()
+        return self.metrics
+
+    def hasHandler(self, name):
+        """Return True if someone is listening for the named event"""
+        return bool(self.handlers.get(name))
+
+    async def dispatchBackpressure(self):
+        """Wait until any blocking dispatch queues have room for more events"""
+        for queue in self.queues.values():
+            if queue.policy == 'block':
+                await queue.waitForRoom()
 
 
 class PrimusClient(EventPublisher):
     """Client nub for talking to primus servers"""
 
-    def __init__(self):
-        """Constructor"""
+    def __init__(self, loads=None, maxQueuedBytes=1024 * 1024, maxQueuedFrames=1000, codec=None):
+        """Constructor
+
+        :param loads: The function used to decode JSON frames, by default the fastest
+                      installed decoder (orjson, ujson or the standard json module)
+        :param maxQueuedBytes: The high water mark for outbound data, senders wait beyond this
+        :param maxQueuedFrames: The high water mark for outbound frames
+        :param codec: The wire parser the server uses: 'json' (the default), 'msgpack', a codec
+                      object, or 'auto' to follow whatever kind of frames (text or binary) the
+                      server sends.  With 'auto' nothing is sent until the server's first frame
+                      arrives, so only use it with servers that speak first (i.e. promptly
+                      send a ping or event after connecting), calls made before then fail
+                      after their timeout.
+        """
         super().__init__()
+        self.autoCodec = codec == 'auto'
+        self.codec = JsonCodec(loads) if codec in (None, 'json', 'auto') else getCodec(codec)
+        self.codecKnown = asyncio.Event()  # set once we know how to encode what we send
+        if not self.autoCodec:
+            self.codecKnown.set()
+        self.maxQueuedBytes = maxQueuedBytes
+        self.maxQueuedFrames = maxQueuedFrames
+        self.ws = None
+        self.writer = None
+
+    def wantsFrame(self, msg):
+        """Return False if nobody would care about this (undecoded) frame, so we can skip
+        parsing it.  Subclasses that know the message framing can look at the frame header."""
+        return self.hasHandler('message')
 
     def connect(self, server):
-        self.ws = websockets.connect(server)
+        """Connect to a server and process messages until the connection closes (blocking)"""
+        asyncio.get_event_loop().run_until_complete(self.run(server))
 
-        async def listener():
-            async with self.ws as ws:
+    async def run(self, server):
+        """Connect to a server and process messages until the connection closes (or close() is
+        called)
+
+        Any number of clients can be run at once on the same event loop.
+        """
+        self.loop = asyncio.get_event_loop()
+        self.closing = False
+        # The connection runs in a task of its own, so close() doesn't cancel our caller
+        self.task = asyncio.ensure_future(self._connection(server))
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            if not self.closing:
+                raise
+
+    async def _connection(self, server):
+        self.ws = None
+        if self.autoCodec:
+            self.codecKnown.clear()  # each connection works out its server's codec afresh
+
+        async with websockets.connect(server) as ws:
+            self.ws = ws
+            self.writer = FrameWriter(ws, self.maxQueuedBytes, self.maxQueuedFrames, self.metrics)
+            try:
                 while True:
                     msg = await ws.recv()
-                    logging.debug(f"< {msg}")
-                    ping = pingPattern.match(msg)
-                    if ping:
-                        logging.info("Sending pong")
-                        await ws.send(f"primus::pong::{ping.group(1)}")
+                    logging.debug("< %s", msg)
+                    metrics = self.metrics
+                    if metrics:
+                        metrics.frameIn(msg)
+                    if self.autoCodec and not self.codecKnown.is_set():
+                        self.codec = codecForFrame(msg)
+                        self.codecKnown.set()
+
+                    if self.codec.binary:
+                        # No cheap way to peek into binary frames, so always decode them
+                        decoded = self._decode(msg)
+                        if isinstance(decoded, str) and decoded.startswith('primus::ping::'):
+                            self._pong(decoded[len('primus::ping::'):])
+                            continue
+                    elif msg.startswith(pingPrefix):
+                        self._pong(pingPattern.match(msg).group(1))
+                        continue
+                    elif self.wantsFrame(msg):
+                        decoded = self._decode(msg)
                     else:
-                        asJson = json.loads(msg)
-                        logging.debug(f"Received msg {asJson}")
-                        self.call_handler('message', asJson)
+                        if metrics:
+                            metrics.skipped += 1
+                        continue
+
+                    self.call_handler('message', decoded)
+                    await self.dispatchBackpressure()
+            finally:
+                self.writer.close()
+                self.ws = None
+                self.codecKnown.set()  # wake any senders, they will find we are closed
+                self.call_handler('disconnect')
 
-        asyncio.get_event_loop().run_until_complete(listener())
+    def _decode(self, msg):
+        if not self.metrics:
+            return self.codec.decode(msg)
+        start = time.perf_counter()
+        decoded = self.codec.decode(msg)
+        self.metrics.decodeTime.record(time.perf_counter() - start)
+        return decoded
+
+    def _pong(self, timestamp):
+        """Answer a primus::ping::<timestamp> heartbeat"""
+        if self.metrics:
+            self.metrics.ping(timestamp)
+        logging.info("Sending pong")
+        self.writer.put(self.codec.encode(f"primus::pong::{timestamp}"), PRIORITY_HEARTBEAT, 'pong')
+
+    def enableMetrics(self):
+        """Start collecting metrics (see Metrics.snapshot), returns the Metrics"""
+        metrics = super().enableMetrics()
+        if self.writer:
+            self.writer.metrics = metrics
+        return metrics
+
+    async def send(self, msg, priority=PRIORITY_NORMAL, abandoned=None):
+        """Queue a raw (already encoded) frame to the server
+
+        Normal priority senders wait here while the outbound queue is over its high water mark.
+        :param abandoned: An optional future, if it is done before the frame is queued (i.e. the
+                          call the frame is for timed out) we stop waiting and drop the frame
+        """
+        if self.writer is None:
+            raise ConnectionError('Not connected')
+        await self.writer.send(msg, priority, abandoned=abandoned)
+
+    async def sendObject(self, obj, priority=PRIORITY_NORMAL, abandoned=None):
+        """Encode an object with our codec and queue it to the server (see send)
+
+        With codec='auto' this waits until the server's first frame tells us which codec to use
+        (or until abandoned is done, or the connection closes).
+        """
+        if self.writer is None or self.writer.closed:
+            raise ConnectionError('Not connected')
+        if not self.codecKnown.is_set():
+            await waitUnlessDone(self.codecKnown.wait(), abandoned)
+            if abandoned is not None and abandoned.done():
+                return
+        await self.send(self.codec.encode(obj), priority, abandoned)
 
     def close(self):
-        """Shut down our connection to the server"""
-        # await asyncio.wait({self.task})
-        #
+        """Shut down our connection to the server (run() then returns)"""
+        task = getattr(self, 'task', None)
+        if task and not task.done():
+            self.closing = True
+            task.cancel()
 
 
 """
@@ -0,0 +1,153 @@
+import base64
+import hashlib
+import mmap
+import weakref
+
+
+class LazyBlob:
+    """A stand-in for a large string value whose bytes live in a SpillArea
+
+    The text is only rebuilt when asked for (str(blob) or blob.text).  For data URIs
+    (i.e. ``data:image/png;base64,...``) decoded() returns the decoded bytes.  Blobs compare
+    equal to (and hash like) their text and len() is its length in characters.  Pickling a
+    blob (i.e. to hand an event to a process pool) gives a plain str.
+    """
+
+    __slots__ = ('area', 'offset', 'length', 'chars', '__weakref__')
+
+    def __init__(self, area, offset, length, chars):
+        self.area = area
+        self.offset = offset
+        self.length = length  # in bytes (utf-8)
+        self.chars = chars  # the length of the text
+
+    @property
+    def text(self):
+        return self.area.read(self.offset, self.length).decode('utf-8')
+
+    def __str__(self):
+        return self.text
+
+    def __len__(self):
+        return self.chars
+
+    def __eq__(self, other):
+        if isinstance(other, LazyBlob):
+            if other.area is self.area and other.offset == self.offset:
+                return True
+            other = other.text
+        elif not isinstance(other, str):
+            return NotImplemented
+        return self.chars == len(other) and self.text == other
+
+    def __hash__(self):
+        return hash(self.text)
+
+    def __reduce__(self):
+        return (str, (self.text,))
+
+    def __repr__(self):
+        return f'<LazyBlob {self.length} bytes>'
+
+    def decoded(self):
+        """Return the bytes of a base64 data URI (or the utf-8 bytes of any other value)"""
+        raw = self.area.read(self.offset, self.length)
+        header, sep, body = raw.partition(b',')
+        if sep and header.startswith(b'data:') and header.endswith(b';base64'):
+            return base64.b64decode(body)
+        return raw
+
+
+class SpillArea:
+    """A memory mapped (anonymous) region holding the bytes of large string values
+
+    Identical values share one LazyBlob.  Space used by blobs nobody references any more is
+    reclaimed when the region fills up.
+    """
+
+    def __init__(self, size=16 * 1024 * 1024):
+        """Constructor
+
+        :param size: The initial size of the region in bytes (it grows if needed)
+        """
+        self.buf = mmap.mmap(-1, size)
+        self.used = 0
+        self.blobs = weakref.WeakValueDictionary()  # digest -> live LazyBlob
+
+    def store(self, text):
+        """Move a string into the spill area, returning a LazyBlob for it"""
+        raw = text.encode('utf-8')
+        digest = hashlib.blake2b(raw, digest_size=16).digest()
+        blob = self.blobs.get(digest)
+        if blob is None:
+            offset = self._alloc(len(raw))
+            self.buf[offset:offset + len(raw)] = raw
+            blob = LazyBlob(self, offset, len(raw), len(text))
+            self.blobs[digest] = blob
+        return blob
+
+    def read(self, offset, length):
+        return self.buf[offset:offset + length]
+
+    def _alloc(self, n):
+        if self.used + n > len(self.buf):
+            self._compact(n)
+        offset = self.used
+        self.used += n
+        return offset
+
+    def _compact(self, n):
+        """Copy the live blobs into a fresh region (growing it if they fill more than half)"""
+        live = sorted(self.blobs.values(), key=lambda b: b.offset)
+        needed = sum(b.length for b in live) + n
+        size = len(self.buf)
+        while needed > size // 2:
+            size *= 2
+        buf = mmap.mmap(-1, size)
+        pos = 0
+        for b in live:
+            buf[pos:pos + b.length] = self.buf[b.offset:b.offset + b.length]
+            b.offset = pos
+            pos += b.length
+        self.buf.close()
+        self.buf = buf
+        self.used = pos
+
+
+class Spiller:
+    """Replaces large string values in decoded payloads with LazyBlobs"""
+
+    def __init__(self, paths=(), threshold=None, area=None):
+        """Constructor
+
+        :param paths: Dotted paths of values to spill, i.e. ``'debugImage'`` or ``'display.html'``
+        :param threshold: If set, also spill any string value (anywhere in the payload) of at
+                          least this many characters
+        :param area: The SpillArea to use (a new one by default)
+        """
+        self.paths = [p.split('.') for p in paths]
+        self.threshold = threshold
+        self.area = area or SpillArea()
+
+    def spill(self, payload):
+        """Spill the large values of a payload (in place), returning the payload"""
+        for path in self.paths:
+            parent = payload
+            for key in path[:-1]:
+                parent = parent.get(key) if isinstance(parent, dict) else None
+            if isinstance(parent, dict):
+                value = parent.get(path[-1])
+                if isinstance(value, str):
+                    parent[path[-1]] = self.area.store(value)
+        if self.threshold is not None:
+            self._spillLarge(payload)
+        return payload
+
+    def _spillLarge(self, node):
+        items = node.items() if isinstance(node, dict) else enumerate(node)
+        for key, value in items:
+            if isinstance(value, str):
+                if len(value) >= self.threshold:
+                    node[key] = self.area.store(value)
+            elif isinstance(value, (dict, list)):
+                self._spillLarge(value)
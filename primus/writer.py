@@ -0,0 +1,124 @@
+import asyncio
+import heapq
+import itertools
+import logging
+
+# Frame priorities, lower numbers are sent first
+PRIORITY_HEARTBEAT = 0
+PRIORITY_AUTH = 1
+PRIORITY_NORMAL = 2
+
+
+async def waitUnlessDone(aw, abandoned):
+    """Wait for aw, but give up (cancelling it) if the future abandoned completes first"""
+    if abandoned is None:
+        await aw
+        return
+    task = asyncio.ensure_future(aw)
+    try:
+        await asyncio.wait((task, abandoned), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        task.cancel()
+
+
+class FrameWriter:
+    """The single outbound writer for a connection
+
+    Frames are sent in priority order (heartbeats, then auth, then everything else) and in
+    order of arrival within a priority.  Normal priority senders wait while more than
+    maxBytes/maxFrames are queued, heartbeat and auth frames are never held back.
+    """
+
+    def __init__(self, ws, maxBytes=1024 * 1024, maxFrames=1000, metrics=None):
+        """Constructor
+
+        :param ws: The websocket to write to
+        :param maxBytes: The high water mark for queued data
+        :param maxFrames: The high water mark for queued frames
+        :param metrics: An optional Metrics to count sent frames in
+        """
+        self.ws = ws
+        self.metrics = metrics
+        self.maxBytes = maxBytes
+        self.maxFrames = maxFrames
+        self.queue = []  # a heap of [priority, seq, frame, key]
+        self.seq = itertools.count()
+        self.keyed = {}  # key -> queued entry that a newer frame with that key replaces
+        self.bytes = 0
+        self.ready = asyncio.Event()
+        self.room = asyncio.Event()
+        self.room.set()
+        self.closed = False
+        self.task = asyncio.ensure_future(self._run())
+
+    def isFull(self):
+        return self.bytes >= self.maxBytes or len(self.queue) >= self.maxFrames
+
+    def put(self, frame, priority=PRIORITY_NORMAL, key=None):
+        """Queue a frame without waiting
+
+        :param key: If set, a frame with the same key that is still queued is replaced by this
+                    one rather than both being sent (i.e. only the latest pong matters)
+        """
+        if self.closed:
+            raise ConnectionError('Connection closed')
+        entry = self.keyed.get(key) if key else None
+        if entry:
+            self.bytes += len(frame) - len(entry[2])
+            entry[2] = frame
+            return
+        entry = [priority, next(self.seq), frame, key]
+        heapq.heappush(self.queue, entry)
+        self.bytes += len(frame)
+        if key:
+            self.keyed[key] = entry
+        if self.isFull():
+            self.room.clear()
+        self.ready.set()
+
+    async def send(self, frame, priority=PRIORITY_NORMAL, key=None, abandoned=None):
+        """Queue a frame, waiting first if the queue is over its high water mark
+
+        :param abandoned: An optional future (i.e. for the result of the call being sent), if
+                          it is done before the frame is queued, we stop waiting and the frame
+                          is dropped
+        """
+        if priority >= PRIORITY_NORMAL:
+            while self.isFull() and not self.closed:
+                if abandoned is not None and abandoned.done():
+                    break
+                await waitUnlessDone(self.room.wait(), abandoned)
+        if abandoned is not None and abandoned.done():
+            logging.debug('Not sending frame for an abandoned call')
+            return
+        self.put(frame, priority, key)
+
+    async def _run(self):
+        try:
+            while True:
+                while not self.queue:
+                    self.ready.clear()
+                    await self.ready.wait()
+                priority, seq, frame, key = heapq.heappop(self.queue)
+                if key:
+                    self.keyed.pop(key, None)
+                self.bytes -= len(frame)
+                if not self.isFull():
+                    self.room.set()
+                logging.debug("> %s", frame)
+                await self.ws.send(frame)
+                if self.metrics:
+                    self.metrics.frameOut(frame)
+        except asyncio.CancelledError:
+            pass
+        except Exception as ex:
+            logging.error(f'Failed writing to server: {ex}')
+        finally:
+            self.close()
+
+    def close(self):
+        """Stop writing, anything still queued is discarded"""
+        self.closed = True
+        self.room.set()  # wake any blocked senders so they see we are closed
+        if not self.task.done():
+            self.task.cancel()
@@ -26,6 +26,9 @@ setup(
     packages=["ezdevice"],
     include_package_data=True,
     install_requires=["websockets"],
+    extras_require={
+        "msgpack": ["msgpack"],
+    },
     python_requires='>=3.6',
     entry_points={
         "console_scripts": [
@@ -0,0 +1,26 @@
+import asyncio
+import pytest
+from primus.feathers import FeathersClient
+from primus.mockserver import MockServer
+
+
+@pytest.fixture
+def client():
+    """Returns run(test, clientArgs=None, **serverArgs), which runs the coroutine test(client)
+    with a FeathersClient (built with clientArgs) connected to a MockServer"""
+    def run(test, clientArgs=None, **serverArgs):
+        async def main():
+            async with MockServer(**serverArgs) as server:
+                c = FeathersClient(**(clientArgs or {}))
+                c.server = server
+                runner = asyncio.ensure_future(c.run(server.url))
+                while c.writer is None:
+                    await asyncio.sleep(0.001)
+                try:
+                    await test(c)
+                finally:
+                    c.close()
+                    await asyncio.gather(runner, return_exceptions=True)
+
+        asyncio.run(main())
+    return run
@@ -0,0 +1,112 @@
+import asyncio
+import pytest
+from primus.batch import GetBatcher
+from primus.feathers import FeathersError
+
+
+class FakeClient:
+    """Answers calls from a dict of records, recording each call"""
+
+    def __init__(self, records, findLimit=None, findFails=False, findResult=False):
+        self.records = records
+        self.findLimit = findLimit
+        self.findFails = findFails
+        self.findResult = findResult  # if set, what find returns
+        self.calls = []
+
+    async def serverCall(self, method, service, arg, options):
+        self.calls.append((method, arg))
+        await asyncio.sleep(0.01)
+        if method == 'get':
+            if arg not in self.records:
+                raise FeathersError({'name': 'NotFound', 'message': 'nope', 'code': 404})
+            return self.records[arg]
+        if self.findFails:
+            raise FeathersError({'name': 'MethodNotAllowed', 'message': 'no find', 'code': 405})
+        if self.findResult is not False:
+            return self.findResult
+        found = [self.records[id] for id in arg['_id']['$in'] if id in self.records]
+        return found[:self.findLimit] if self.findLimit else found
+
+
+records = {id: {'_id': id} for id in 'abcd'}
+
+
+def test_concurrent_gets_share_one_find():
+    async def main():
+        client = FakeClient(records)
+        batcher = GetBatcher(client)
+        got = await asyncio.gather(*[batcher.get('devs', id) for id in 'abcab'])
+        assert [r['_id'] for r in got] == list('abcab')
+        assert client.calls == [('find', {'_id': {'$in': ['a', 'b', 'c']}, '$limit': 3})]
+
+    asyncio.run(main())
+
+
+def test_truncated_find_falls_back_to_gets():
+    async def main():
+        client = FakeClient(records, findLimit=2)
+        batcher = GetBatcher(client)
+        got = await asyncio.gather(*[batcher.get('devs', id) for id in 'abcd'])
+        assert [r['_id'] for r in got] == list('abcd')
+        assert ('get', 'c') in client.calls and ('get', 'd') in client.calls
+
+    asyncio.run(main())
+
+
+def test_failed_find_falls_back_to_gets():
+    async def main():
+        client = FakeClient(records, findFails=True)
+        batcher = GetBatcher(client)
+        got = await asyncio.gather(batcher.get('devs', 'a'), batcher.get('devs', 'b'))
+        assert [r['_id'] for r in got] == ['a', 'b']
+
+    asyncio.run(main())
+
+
+def test_odd_find_results_fall_back_to_gets():
+    async def main():
+        for findResult in (None, 'oops', [None], {'data': None}):
+            client = FakeClient(records, findResult=findResult)
+            batcher = GetBatcher(client)
+            got = await asyncio.wait_for(
+                asyncio.gather(batcher.get('devs', 'a'), batcher.get('devs', 'b')), 1)
+            assert [r['_id'] for r in got] == ['a', 'b']
+
+    asyncio.run(main())
+
+
+def test_paginated_find_results_are_unwrapped():
+    async def main():
+        client = FakeClient(records, findResult={'total': 2, 'data': [{'_id': 'a'}, {'_id': 'b'}]})
+        batcher = GetBatcher(client)
+        got = await asyncio.gather(batcher.get('devs', 'a'), batcher.get('devs', 'b'))
+        assert [r['_id'] for r in got] == ['a', 'b']
+        assert [method for method, arg in client.calls] == ['find']
+
+    asyncio.run(main())
+
+
+def test_missing_record_gets_the_servers_error():
+    async def main():
+        client = FakeClient(records)
+        batcher = GetBatcher(client)
+        results = await asyncio.gather(batcher.get('devs', 'a'), batcher.get('devs', 'zz'),
+                                       return_exceptions=True)
+        assert results[0] == {'_id': 'a'}
+        assert isinstance(results[1], FeathersError) and results[1].code == 404
+
+    asyncio.run(main())
+
+
+def test_cancelled_caller_does_not_cancel_others(client):
+    async def main(client):
+        client.enableBatching()
+        first = asyncio.ensure_future(
+            asyncio.wait_for(client.serverGet('ezdevs', 'JTB4E62DEA0000'), 0.01))
+        second = asyncio.ensure_future(client.serverGet('ezdevs', 'JTB4E62DEA0000'))
+        with pytest.raises(asyncio.TimeoutError):
+            await first
+        assert (await second)['_id'] == 'JTB4E62DEA0000'
+
+    client(main, latency=0.05)
@@ -0,0 +1,126 @@
+import asyncio
+from primus.cache import RecordCache
+
+deviceId = 'JTB4E62DEA0000'
+
+
+def test_get_hits_and_misses():
+    cache = RecordCache()
+    assert cache.get('devs', 'a') is None
+    cache.putRecord('devs', {'_id': 'a'})
+    assert cache.get('devs', 'a') == {'_id': 'a'}
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+
+
+def test_lru_eviction():
+    cache = RecordCache(maxRecords=2)
+    cache.putRecord('devs', {'_id': 'a'})
+    cache.putRecord('devs', {'_id': 'b'})
+    cache.get('devs', 'a')  # b is now the least recently used
+    cache.putRecord('devs', {'_id': 'c'})
+    assert cache.get('devs', 'b') is None
+    assert cache.get('devs', 'a') is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_events_update_records_and_finds():
+    cache = RecordCache()
+    cache.putFind('devs', {'status': 'on'}, [{'_id': 'a', 'status': 'on'},
+                                             {'_id': 'b', 'status': 'on'}])
+    cache.changed('devs', {'_id': 'a', 'status': 'off'})
+    cache.changed('devs', {'_id': 'b', 'status': 'on', 'v': 2})
+    cache.changed('devs', {'_id': 'c', 'status': 'on'})
+    assert cache.find('devs', {'status': 'on'}) == [{'_id': 'b', 'status': 'on', 'v': 2},
+                                                    {'_id': 'c', 'status': 'on'}]
+    assert cache.get('devs', 'a') == {'_id': 'a', 'status': 'off'}
+
+    cache.changed('devs', {'_id': 'b'}, removed=True)
+    assert cache.get('devs', 'b') is None
+    assert cache.find('devs', {'status': 'on'}) == [{'_id': 'c', 'status': 'on'}]
+
+
+def test_paginated_finds_are_invalidated():
+    cache = RecordCache()
+    cache.putFind('devs', {'$limit': 1}, [{'_id': 'a'}])
+    cache.changed('devs', {'_id': 'b'})
+    assert cache.find('devs', {'$limit': 1}) is None
+
+
+def test_other_services_are_untouched():
+    cache = RecordCache()
+    cache.putFind('users', {}, [{'_id': 'a'}])
+    cache.changed('devs', {'_id': 'b'})
+    assert cache.find('users', {}) == [{'_id': 'a'}]
+
+
+def test_queries_we_cannot_evaluate_are_invalidated():
+    for query in ({'name': {'$like': 'foo%'}}, {'display.mode': 'forever'},
+                  {'display': {'mode': 'forever'}}, {'$or': [{'name': 'a'}]}):
+        cache = RecordCache()
+        cache.putFind('devs', query, [{'_id': 'a', 'name': 'foo'}])
+        cache.changed('devs', {'_id': 'b', 'name': 'bar', 'display': {'mode': 'forever'}})
+        assert cache.find('devs', query) is None, query
+
+
+def test_operator_queries_are_kept_current():
+    cache = RecordCache()
+    query = {'firmwareNum': {'$gte': 30}, 'status': {'$in': ['online', 'idle']}}
+    cache.putFind('devs', query, [])
+    cache.changed('devs', {'_id': 'a', 'firmwareNum': 34, 'status': 'online'})
+    cache.changed('devs', {'_id': 'b', 'firmwareNum': 20, 'status': 'online'})
+    cache.changed('devs', {'_id': 'c', 'firmwareNum': 34, 'status': 'offline'})
+    assert cache.find('devs', query) == [{'_id': 'a', 'firmwareNum': 34, 'status': 'online'}]
+
+
+def test_replies_older_than_an_event_are_not_stored():
+    cache = RecordCache()
+    since = cache.seq
+    cache.changed('devs', {'_id': 'a', 'v': 2})
+    cache.putRecord('devs', {'_id': 'a', 'v': 1}, since)
+    assert cache.get('devs', 'a') is None
+    cache.putRecord('devs', {'_id': 'b', 'v': 1}, since)
+    assert cache.get('devs', 'b') == {'_id': 'b', 'v': 1}
+
+    since = cache.seq
+    cache.changed('devs', {'_id': 'c'})
+    cache.putFind('devs', {}, [{'_id': 'd'}], since)
+    assert cache.find('devs', {}) is None
+    assert cache.get('devs', 'd') == {'_id': 'd'}
+
+
+def test_forgotten_events_are_assumed_to_be_newer():
+    cache = RecordCache(maxRecords=1)
+    since = cache.seq
+    cache.changed('devs', {'_id': 'a', 'v': 2})
+    cache.changed('devs', {'_id': 'b', 'v': 2})
+    cache.putRecord('devs', {'_id': 'a', 'v': 1}, since)
+    assert cache.get('devs', 'a') is None
+
+
+def test_cache_follows_patches(client):
+    async def main(c):
+        c.enableCache()
+        await c.serverGet('ezdevs', deviceId)
+        await c.serverPatch('ezdevs', deviceId, {'status': 'off'})
+        await asyncio.sleep(0.02)
+        assert (await c.serverGet('ezdevs', deviceId))['status'] == 'off'
+        assert c.cache.stats()['hits'] == 1
+
+    client(main)
+
+
+def test_get_reply_racing_an_event_is_not_cached(client):
+    async def main(c):
+        c.enableCache()
+        get = asyncio.ensure_future(c.serverGet('ezdevs', deviceId))
+        await asyncio.sleep(0.01)
+        # An event about the record overtakes the (older) get reply
+        newer = dict(c.server.services['ezdevs'][deviceId], status='newer')
+        await c.server.emit('ezdevs patched', newer)
+        assert (await get)['status'] == 'online'
+        assert c.cache.get('ezdevs', deviceId) is None
+        assert (await c.serverGet('ezdevs', deviceId))['status'] == 'online'
+        assert c.server.calls.count(('get', 'ezdevs')) == 2
+
+    client(main, latency=0.05)
@@ -0,0 +1,76 @@
+import asyncio
+from primus.coalesce import Coalescer
+from primus.feathers import FeathersClient
+
+
+def collect():
+    delivered = []
+    return delivered, lambda eventName, payload: delivered.append((eventName, payload))
+
+
+def test_latest_event_wins_across_event_names():
+    delivered, deliver = collect()
+    c = Coalescer(deliver, window=None)
+    c.add('ezdevs patched', {'_id': 'a', 'v': 0})
+    c.add('ezdevs updated', {'_id': 'a', 'v': 1})
+    c.add('ezdevs patched', {'_id': 'a', 'v': 2})
+    c.drain()
+    assert delivered == [('ezdevs patched', {'_id': 'a', 'v': 2})]
+
+
+def test_newer_payload_replaces_rather_than_merges():
+    delivered, deliver = collect()
+    c = Coalescer(deliver, window=None)
+    c.add('ezdevs patched', {'_id': 'a', 'gone': True})
+    c.add('ezdevs updated', {'_id': 'a'})
+    c.drain()
+    assert delivered == [('ezdevs updated', {'_id': 'a'})]
+
+
+def test_flush_record_only_delivers_that_record():
+    delivered, deliver = collect()
+    c = Coalescer(deliver, window=None)
+    c.add('ezdevs patched', {'_id': 'a'})
+    c.add('ezdevs patched', {'_id': 'b'})
+    c.flushRecord('b')
+    assert delivered == [('ezdevs patched', {'_id': 'b'})]
+    c.drain()
+    assert delivered[-1] == ('ezdevs patched', {'_id': 'a'})
+
+
+def test_window_delivers_once():
+    async def main():
+        delivered, deliver = collect()
+        c = Coalescer(deliver, window=0.01)
+        for i in range(5):
+            c.add('ezdevs patched', {'_id': 'a', 'v': i})
+        assert delivered == []
+        await asyncio.sleep(0.05)
+        assert delivered == [('ezdevs patched', {'_id': 'a', 'v': 4})]
+
+    asyncio.run(main())
+
+
+def test_payloads_without_ids_are_not_held():
+    delivered, deliver = collect()
+    c = Coalescer(deliver, window=None)
+    c.add('ezdevs patched', {'name': 'x'})
+    assert delivered == [('ezdevs patched', {'name': 'x'})]
+
+
+def test_client_flushes_queued_update_before_other_events():
+    delivered = []
+    client = FeathersClient()
+    client.coalesce('ezdevs', window=None)
+    for method in ('patched', 'removed'):
+        client.on(f'ezdevs {method}',
+                  lambda payload, method=method: delivered.append((method, payload['v'])))
+
+    def event(eventName, payload):
+        client.call_handler('message', {'type': 0, 'data': [eventName, payload]})
+
+    event('ezdevs patched', {'_id': 'a', 'v': 1})
+    event('ezdevs patched', {'_id': 'a', 'v': 2})
+    assert delivered == []
+    event('ezdevs removed', {'_id': 'a', 'v': 3})
+    assert delivered == [('patched', 2), ('removed', 3)]
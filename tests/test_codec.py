@@ -0,0 +1,68 @@
+import asyncio
+import pytest
+import time
+from primus.codec import JsonCodec, MsgpackCodec, codecForFrame, getCodec
+from primus.feathers import FeathersClient
+from primus.mockserver import MockServer
+from primus.spill import SpillArea
+
+deviceId = 'JTB4E62DEA0000'
+
+
+def test_codecs_round_trip_spilled_values():
+    blob = SpillArea().store('x' * 100)
+    for codec in (getCodec('json'), getCodec('msgpack')):
+        frame = codec.encode({'type': 0, 'data': ['ezdevs patched', {'debugImage': blob}]})
+        assert codec.decode(frame)['data'][1]['debugImage'] == 'x' * 100
+    with pytest.raises(ValueError):
+        getCodec('xml')
+
+
+def test_codec_for_frame():
+    assert isinstance(codecForFrame('"primus::ping::1"'), JsonCodec)
+    assert isinstance(codecForFrame(b'\xb0primus::ping::1'), MsgpackCodec)
+
+
+def test_msgpack_and_auto_codec(client):
+    async def main(c):
+        # Sent straight away, before the server has said anything
+        assert (await c.serverCall('authenticate', {}))['accessToken']
+        assert c.codec.name == 'msgpack'
+        assert (await c.serverGet('ezdevs', deviceId))['_id'] == deviceId
+
+    client(main, clientArgs={'codec': 'auto'}, codec='msgpack', pingInterval=0.01)
+
+
+def test_auto_codec_calls_time_out_if_the_server_never_speaks(client):
+    async def main(c):
+        start = time.perf_counter()
+        with pytest.raises(asyncio.TimeoutError, match='No reply from server'):
+            await asyncio.wait_for(c.serverCall('authenticate', {}), 2)
+        with pytest.raises(asyncio.TimeoutError, match='No reply from server'):
+            await asyncio.wait_for(c.serverGet('ezdevs', deviceId), 2)
+        assert time.perf_counter() - start < 1
+        assert c.pendingCalls == {}
+        assert c.server.calls == []
+
+    client(main, clientArgs={'codec': 'auto', 'callTimeout': 0.2}, pingInterval=None)
+
+
+def test_auto_codec_calls_fail_once_closed():
+    async def main():
+        async with MockServer(pingInterval=None) as server:
+            c = FeathersClient(codec='auto', callTimeout=None)
+            with pytest.raises(ConnectionError):
+                await c.serverCall('authenticate', {})  # not connected yet
+            runner = asyncio.ensure_future(c.run(server.url))
+            while c.writer is None:
+                await asyncio.sleep(0.001)
+            waiting = asyncio.ensure_future(c.serverCall('authenticate', {}))
+            await asyncio.sleep(0.01)
+            c.close()
+            await runner
+            with pytest.raises(ConnectionError):
+                await asyncio.wait_for(waiting, 1)
+            with pytest.raises(ConnectionError):
+                await asyncio.wait_for(c.serverCall('authenticate', {}), 1)
+
+    asyncio.run(main())
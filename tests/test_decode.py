@@ -0,0 +1,33 @@
+import asyncio
+from primus.feathers import FeathersClient
+
+
+def test_wants_frame_peeks_at_event_header():
+    client = FeathersClient()
+    client.on('ezdevs patched', lambda payload: None)
+    assert client.wantsFrame('{"type":0,"data":["ezdevs patched",{"_id":"a"}]}')
+    assert client.wantsFrame('{"type": 0, "data": ["ezdevs patched", {"_id": "a"}]}')
+    assert not client.wantsFrame('{"type":0,"data":["ezdevs removed",{"_id":"a"}]}')
+    # Function results (and anything we can't peek at) are always decoded
+    assert client.wantsFrame('{"id":1,"type":1,"data":[null,{}]}')
+    assert client.wantsFrame(b'\x83')
+
+
+def test_unsubscribed_events_are_not_decoded(client):
+    async def main(c):
+        c.enableMetrics()
+        await asyncio.sleep(0.1)
+        assert c.metrics.skipped > 0
+        assert c.metrics.decodeTime.count == 0
+
+    client(main, eventRate=200)
+
+
+def test_subscribed_events_are_decoded(client):
+    async def main(c):
+        got = []
+        c.on('ezdevs patched', got.append)
+        await asyncio.sleep(0.1)
+        assert got and got[0]['_id'].startswith('JTB4E62DEA')
+
+    client(main, eventRate=200)
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from primus.feathers import FeathersClient
+from primus.mockserver import MockServer
+from primus.primus import EventPublisher
+
+
+def test_every_subscriber_is_called_in_order():
+    publisher = EventPublisher()
+    got = []
+    first = publisher.on('tick', lambda v: got.append(('first', v)))
+    publisher.on('tick', lambda v: got.append(('second', v)))
+    publisher.call_handler('tick', 1)
+    assert got == [('first', 1), ('second', 1)]
+    assert first is None  # on() only returns the handler when used as a decorator
+
+
+def test_off_removes_one_or_all_handlers():
+    publisher = EventPublisher()
+    got = []
+
+    def first(v):
+        got.append(('first', v))
+
+    publisher.on('tick', first)
+    publisher.on('tick', lambda v: got.append(('second', v)))
+    publisher.off('tick', first)
+    publisher.call_handler('tick', 1)
+    assert got == [('second', 1)]
+    publisher.off('tick')
+    assert not publisher.hasHandler('tick')
+    publisher.call_handler('tick', 2)
+    assert got == [('second', 1)]
+
+
+def test_drop_policy_counts_dropped_events():
+    async def main():
+        publisher = EventPublisher()
+        got = []
+        publisher.on('tick', got.append)
+        publisher.route('tick', maxSize=2, policy='drop')
+        for i in range(5):
+            publisher.call_handler('tick', i)
+        assert publisher.queues['tick'].dropped == 3
+        await asyncio.sleep(0.01)
+        assert got == [0, 1]
+
+    asyncio.run(main())
+
+
+def test_block_policy_waits_for_room():
+    async def main():
+        publisher = EventPublisher()
+        gate = asyncio.Event()
+        got = []
+
+        @publisher.on('tick')
+        async def slow(v):
+            await gate.wait()
+            got.append(v)
+
+        publisher.route('tick', maxSize=1, policy='block')
+        publisher.call_handler('tick', 1)
+        await asyncio.sleep(0.01)  # the worker is now stuck on the first call
+        publisher.call_handler('tick', 2)
+        backpressure = asyncio.ensure_future(publisher.dispatchBackpressure())
+        await asyncio.sleep(0.01)
+        assert not backpressure.done()
+        gate.set()
+        await asyncio.wait_for(backpressure, 1)
+        await asyncio.sleep(0.01)
+        assert got == [1, 2]
+
+    asyncio.run(main())
+
+
+def test_block_policy_stalls_the_receive_loop():
+    async def main():
+        async with MockServer(eventRate=None, eventCount=50, pingInterval=None) as server:
+            client = FeathersClient()
+            metrics = client.enableMetrics()
+            gate = asyncio.Event()
+            got = []
+
+            @client.on('ezdevs patched')
+            async def slow(payload):
+                await gate.wait()
+                got.append(payload)
+
+            client.route('ezdevs patched', maxSize=1, policy='block')
+            runner = asyncio.ensure_future(client.run(server.url))
+            await asyncio.sleep(0.1)
+            assert got == []
+            assert metrics.framesIn <= 3  # we stopped reading while the handler was stuck
+            gate.set()
+            while len(got) < 50:
+                await asyncio.sleep(0.01)
+            client.close()
+            await asyncio.gather(runner, return_exceptions=True)
+
+    asyncio.run(main())
+
+
+def test_executor_runs_plain_handlers_off_the_loop():
+    async def main():
+        publisher = EventPublisher()
+        threads = []
+        publisher.on('tick', lambda v: threads.append(threading.get_ident()))
+        with ThreadPoolExecutor(1) as executor:
+            publisher.route('tick', executor=executor)
+            publisher.call_handler('tick', 1)
+            await asyncio.sleep(0.05)
+        assert threads and threads[0] != threading.get_ident()
+
+    asyncio.run(main())
+
+
+def test_coroutine_handler_errors_are_logged(caplog):
+    async def main():
+        publisher = EventPublisher()
+
+        @publisher.on('tick')
+        async def broken(v):
+            raise ValueError('broken handler')
+
+        publisher.call_handler('tick', 1)
+        await asyncio.sleep(0.01)
+        assert not publisher.tasks
+        publisher.route('tick')
+        publisher.call_handler('tick', 2)
+        await asyncio.sleep(0.01)
+
+    with caplog.at_level(logging.ERROR):
+        asyncio.run(main())
+    failures = [r for r in caplog.records if r.exc_info and 'broken handler' in str(r.exc_info[1])]
+    assert [r.getMessage() for r in failures] == ['Event handler failed', 'Handler for tick failed']
@@ -0,0 +1,74 @@
+import asyncio
+import pytest
+from primus.feathers import FeathersClient, FeathersError
+from primus.writer import FrameWriter
+
+deviceId = 'JTB4E62DEA0000'
+
+
+class SilentSocket:
+    """Accepts frames and never answers"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, frame):
+        await asyncio.sleep(0.001)
+        self.sent.append(frame)
+
+
+def silentClient(**kwargs):
+    c = FeathersClient(**kwargs)
+    c.writer = FrameWriter(SilentSocket())
+    return c
+
+
+def test_calls_time_out_and_free_their_slot():
+    async def main():
+        c = silentClient(callTimeout=0.01, maxInFlight=1)
+        with pytest.raises(asyncio.TimeoutError):
+            await c.serverCall('get', 'devs', 'a')
+        await asyncio.sleep(0)
+        assert c.pendingCalls == {}
+        assert c.callWindow._value == 1
+
+    asyncio.run(main())
+
+
+def test_window_limits_calls_in_flight():
+    async def main():
+        c = silentClient(callTimeout=None, maxInFlight=2)
+        calls = [asyncio.ensure_future(c.serverCall('get', 'devs', i)) for i in range(5)]
+        await asyncio.sleep(0.05)
+        assert len(c.pendingCalls) == 2
+        for call in calls:
+            call.cancel()
+        await asyncio.gather(*calls, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert c.pendingCalls == {}
+        assert c.callWindow._value == 2
+
+    asyncio.run(main())
+
+
+def test_results_and_errors(client):
+    async def main(c):
+        assert (await c.serverGet('ezdevs', deviceId))['_id'] == deviceId
+        with pytest.raises(FeathersError) as err:
+            await c.serverGet('ezdevs', 'nope')
+        assert err.value.code == 404
+        records = await asyncio.gather(*[c.serverGet('ezdevs', deviceId) for i in range(50)])
+        assert len(records) == 50
+
+    client(main)
+
+
+def test_pending_calls_fail_on_disconnect(client):
+    async def main(c):
+        call = asyncio.ensure_future(c.serverGet('ezdevs', deviceId))
+        await asyncio.sleep(0.01)
+        await c.server.stop()
+        with pytest.raises(ConnectionError):
+            await call
+
+    client(main, latency=1.0)
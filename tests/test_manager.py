@@ -0,0 +1,67 @@
+import asyncio
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from primus.manager import ConnectionManager
+from primus.mockserver import MockServer
+from primus.primus import PrimusClient
+
+
+def test_coroutine_handlers_on_routed_events():
+    async def main():
+        manager = ConnectionManager()
+        client = manager.add('one', PrimusClient(), 'ws://unused')
+        client.route('tick', executor=ThreadPoolExecutor(1))
+        got = []
+
+        @manager.on('tick')
+        async def handler(c, value):
+            got.append((c, value))
+
+        client.call_handler('tick', 1)
+        await asyncio.sleep(0.05)
+        assert got == [(client, 1)]
+
+    asyncio.run(main())
+
+
+def test_run_finishes_after_close():
+    async def main():
+        class Forever(PrimusClient):
+            async def run(self, server):
+                await asyncio.sleep(1000)
+
+        manager = ConnectionManager()
+        for n in range(3):
+            manager.add(n, Forever(), 'ws://unused')
+        runner = asyncio.ensure_future(manager.run())
+        await asyncio.sleep(0.01)
+        manager.close()
+        await asyncio.wait_for(runner, 1)
+
+    asyncio.run(main())
+
+
+def test_close_only_ends_the_connection():
+    async def main():
+        async with MockServer(pingInterval=None) as server:
+            client = PrimusClient()
+            asyncio.get_event_loop().call_later(0.05, client.close)
+            await asyncio.wait_for(client.run(server.url), 1)  # returns rather than raising
+            await asyncio.sleep(0)
+            return 'still running'
+
+    assert asyncio.run(main()) == 'still running'
+
+
+def test_cancelling_the_caller_still_cancels_run():
+    async def main():
+        async with MockServer(pingInterval=None) as server:
+            client = PrimusClient()
+            runner = asyncio.ensure_future(client.run(server.url))
+            await asyncio.sleep(0.05)
+            runner.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await runner
+            assert client.task.cancelled()
+
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+import asyncio
+import time
+from primus.metrics import Histogram, Metrics, bucketBounds, frameBytes
+
+deviceId = 'JTB4E62DEA0000'
+
+
+def test_histogram_percentiles():
+    h = Histogram()
+    assert h.percentile(50) is None
+    assert h.summary()['mean'] is None
+    for i in range(90):
+        h.record(0.001)
+    for i in range(10):
+        h.record(0.5)
+    summary = h.summary()
+    assert summary['count'] == 100 and summary['max'] == 0.5
+    assert abs(summary['mean'] - (0.09 + 5) / 100) < 1e-9
+    assert 0.001 <= summary['p50'] < 0.0015
+    assert summary['p90'] < 0.0015
+    assert summary['p99'] == 0.5  # clamped to the largest value seen
+
+
+def test_histogram_values_beyond_the_buckets():
+    h = Histogram()
+    h.record(bucketBounds[-1] * 10)
+    assert h.percentile(50) == bucketBounds[-1] * 10
+
+
+def test_bytes_are_counted_as_sent():
+    assert frameBytes('abc') == 3
+    assert frameBytes('café') == 5
+    assert frameBytes(b'\x81\xa1a') == 3
+    metrics = Metrics()
+    metrics.frameIn('"primus::ping::é"')
+    metrics.frameOut(b'\x00\x01')
+    snapshot = metrics.snapshot()
+    assert (snapshot['framesIn'], snapshot['bytesIn']) == (1, 18)
+    assert (snapshot['framesOut'], snapshot['bytesOut']) == (1, 2)
+
+
+def test_reporting_does_not_reset_snapshot_rates():
+    async def main():
+        metrics = Metrics()
+        reports = []
+        metrics.startReporting(reports.append, interval=0.02)
+        metrics.frameIn('x' * 100)
+        await asyncio.sleep(0.05)
+        metrics.stopReporting()
+        assert reports and reports[0]['framesInPerSec'] > 0
+        assert all(r['framesInPerSec'] == 0 for r in reports[1:])
+        # Our own baseline is still from when the metrics were created
+        assert metrics.snapshot()['framesInPerSec'] > 0
+        assert metrics.snapshot()['framesInPerSec'] == 0
+
+    asyncio.run(main())
+
+
+def test_ping_delay():
+    metrics = Metrics()
+    metrics.ping(str(int((time.time() - 0.2) * 1000)))
+    metrics.ping('not a timestamp')
+    assert metrics.heartbeatDelay.count == 1
+    assert 0.15 < metrics.heartbeatDelay.max < 1
+
+
+def test_client_metrics(client):
+    async def main(c):
+        metrics = c.enableMetrics()
+        await c.serverGet('ezdevs', deviceId)
+        await c.serverCall('authenticate', {})
+        await asyncio.sleep(0.05)
+        snapshot = metrics.snapshot()
+        assert set(snapshot['rpcTime']) == {'ezdevs get', 'authenticate'}
+        assert snapshot['heartbeatDelay']['count'] > 0
+        assert snapshot['framesOut'] >= 2 and snapshot['bytesIn'] > 0
+        assert snapshot['pendingCalls'] == 0
+
+    client(main, pingInterval=0.01)
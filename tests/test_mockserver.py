@@ -0,0 +1,66 @@
+import asyncio
+from primus.bench import benchEvents
+from primus.mockserver import MockServer, loadCapture
+
+
+def test_load_the_captured_notes():
+    frames = loadCapture()
+    assert [f['data'][0] for f in frames] == ['ezdevs patched', 'ezdevs patched']
+    assert frames[0]['data'][1]['_id'] == 'JTB4E62DEA32B5'
+
+
+def test_load_a_capture_file(tmp_path):
+    capture = tmp_path / 'capture.txt'
+    capture.write_text('\n'.join([
+        '"primus::ping::1553458994363"\t29\t',
+        '13:23:14.364',
+        'up {"type":0,"data":["get","devices","f0001",{}],"id":1}\t53\t',
+        'down {"id":1,"type":1,"data":[null,{"_id":"f0001"}]}\t40\t',
+        'down: {"type":0,"data":["devices patched",{"_id":"f0001"}]}\t50\t',
+        '{"type":0,"data":["devices removed",{"_id":"f0001"}]}\t50\t',
+        '{"type":0,"data":["devices patched",{"_id":"trunc',
+    ]))
+    frames = loadCapture(str(capture))
+    assert [f['data'][0] for f in frames] == ['devices patched', 'devices removed']
+
+
+def test_replayed_frames_reach_handlers(client):
+    async def main(c):
+        got = []
+        c.on('ezdevs patched', got.append)
+        await asyncio.sleep(0.1)
+        assert got and all(p['_id'] == 'JTB4E62DEA32B5' for p in got)
+
+    client(main, replay=loadCapture(), eventRate=100)
+
+
+def test_replay_is_encoded_with_the_servers_codec(client):
+    async def main(c):
+        got = []
+        c.on('ezdevs patched', got.append)
+        await asyncio.sleep(0.1)
+        assert c.codec.name == 'msgpack'
+        assert got and got[0]['uuid'] == '7e165b3d-ff29-4b73-be7c-85b3944b3cea'
+
+    client(main, clientArgs={'codec': 'msgpack'}, codec='msgpack',
+           replay=loadCapture(), eventRate=100)
+
+
+def test_calls_are_answered_and_mutations_broadcast(client):
+    async def main(c):
+        created = []
+        c.on('ezdevs created', created.append)
+        record = await c.serverCall('create', 'ezdevs', {'status': 'new'}, {})
+        found = await c.serverFind('ezdevs', {'status': 'new'})
+        assert found == [record]
+        await asyncio.sleep(0.01)
+        assert created == [record]
+        assert ('create', 'ezdevs') in c.server.calls
+
+    client(main)
+
+
+def test_bench_events_subscribed_and_not():
+    for subscribed in (True, False):
+        rate = asyncio.run(benchEvents(200, subscribed=subscribed, replay=loadCapture()))
+        assert rate > 0
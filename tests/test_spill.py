@@ -0,0 +1,100 @@
+import asyncio
+import base64
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from primus.spill import LazyBlob, SpillArea, Spiller
+
+deviceId = 'JTB4E62DEA0000'
+
+
+def test_blobs_behave_like_their_text():
+    area = SpillArea()
+    text = 'café ' * 100
+    blob = area.store(text)
+    assert isinstance(blob, LazyBlob)
+    assert str(blob) == text and blob.text == text
+    assert blob == text and text == blob and blob != 'other'
+    assert len(blob) == len(text) and blob.length == len(text.encode('utf-8'))
+    assert hash(blob) == hash(text)
+    assert {text: 1}[blob] == 1
+
+
+def test_blobs_pickle_as_plain_strings():
+    blob = SpillArea().store('x' * 1000)
+    payload = pickle.loads(pickle.dumps({'debugImage': blob}))
+    assert payload == {'debugImage': 'x' * 1000}
+    assert type(payload['debugImage']) is str
+
+
+def test_identical_values_are_stored_once():
+    area = SpillArea()
+    a = area.store('y' * 100)
+    used = area.used
+    b = area.store('y' * 100)
+    assert a is b and area.used == used
+    c = area.store('z' * 100)
+    assert c is not a and c != a and area.used == used + 100
+
+
+def test_compaction_keeps_live_blobs():
+    area = SpillArea(size=64)
+    a = area.store('a' * 20)
+    b = area.store('b' * 20)
+    del b  # its space can be reclaimed
+    c = area.store('c' * 40)
+    assert a.text == 'a' * 20 and c.text == 'c' * 40
+    assert area.used == 60
+    d = area.store('d' * 200)  # doesn't fit, so the area grows
+    assert len(area.buf) >= 2 * (60 + 200)
+    assert (a.text, c.text, d.text) == ('a' * 20, 'c' * 40, 'd' * 200)
+
+
+def test_decoded_data_uris():
+    raw = bytes(range(256))
+    area = SpillArea()
+    image = area.store('data:image/png;base64,' + base64.b64encode(raw).decode('ascii'))
+    assert image.decoded() == raw
+    assert area.store('<html>café</html>').decoded() == '<html>café</html>'.encode('utf-8')
+
+
+def test_spiller_paths_and_threshold():
+    payload = {'_id': 'a', 'display': {'html': '<p>hi</p>', 'mode': 'forever'},
+               'debugImage': 'i' * 50, 'notes': ['n' * 50, 'short']}
+    Spiller(paths=['display.html', 'missing.path']).spill(payload)
+    assert isinstance(payload['display']['html'], LazyBlob)
+    assert isinstance(payload['debugImage'], str)
+    Spiller(threshold=50).spill(payload)
+    assert isinstance(payload['debugImage'], LazyBlob)
+    assert isinstance(payload['notes'][0], LazyBlob) and payload['notes'][1] == 'short'
+    assert payload['display']['mode'] == 'forever'
+
+
+def imageLength(payload):
+    return len(payload['debugImage'])
+
+
+def test_spilled_payloads_can_go_to_a_process_pool():
+    async def main():
+        payload = Spiller(['debugImage']).spill({'_id': 'a', 'debugImage': 'i' * 1000})
+        with ProcessPoolExecutor(1) as executor:
+            assert await asyncio.get_event_loop().run_in_executor(
+                executor, imageLength, payload) == 1000
+
+    asyncio.run(main())
+
+
+def test_records_look_the_same_from_events_and_gets(client):
+    async def main(c):
+        c.spillBlobs(['debugImage'])
+        c.enableCache()
+        got = await c.serverGet('ezdevs', deviceId)
+        assert isinstance(got['debugImage'], LazyBlob)
+        found = await c.serverFind('ezdevs', {'status': 'online'})
+        assert all(isinstance(r['debugImage'], LazyBlob) for r in found)
+        await c.serverPatch('ezdevs', deviceId, {'status': 'off'})
+        await asyncio.sleep(0.02)
+        patched = await c.serverGet('ezdevs', deviceId)
+        assert patched['status'] == 'off' and isinstance(patched['debugImage'], LazyBlob)
+        assert patched['debugImage'] == got['debugImage']
+
+    client(main)
@@ -0,0 +1,146 @@
+import asyncio
+import pytest
+import time
+from primus.feathers import FeathersClient
+from primus.writer import FrameWriter, PRIORITY_HEARTBEAT, PRIORITY_AUTH
+
+
+class SlowSocket:
+    """Records frames, taking a little while to send each one"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, frame):
+        await asyncio.sleep(0.001)
+        self.sent.append(frame)
+
+
+class BlockedSocket:
+    """Doesn't finish sending anything until released"""
+
+    def __init__(self):
+        self.released = asyncio.Event()
+        self.sent = []
+
+    async def send(self, frame):
+        await self.released.wait()
+        self.sent.append(frame)
+
+
+def blockedClient(**kwargs):
+    """Returns a client whose outbound queue is full (maxFrames=1) and stuck"""
+    c = FeathersClient(**kwargs)
+    ws = BlockedSocket()
+    c.writer = FrameWriter(ws, maxFrames=1)
+    c.writer.put('stuck being written')
+    c.writer.put('fills the queue')
+    return c, ws
+
+
+def test_heartbeats_and_auth_go_first():
+    async def main():
+        ws = SlowSocket()
+        writer = FrameWriter(ws)
+        for i in range(5):
+            writer.put(f'call{i}')
+        writer.put('auth', PRIORITY_AUTH)
+        writer.put('pong', PRIORITY_HEARTBEAT)
+        await asyncio.sleep(0.05)
+        assert ws.sent == ['pong', 'auth', 'call0', 'call1', 'call2', 'call3', 'call4']
+        writer.close()
+
+    asyncio.run(main())
+
+
+def test_newer_pong_replaces_queued_one():
+    async def main():
+        ws = SlowSocket()
+        writer = FrameWriter(ws)
+        writer.put('call')
+        writer.put('pong1', PRIORITY_HEARTBEAT, 'pong')
+        writer.put('pong2', PRIORITY_HEARTBEAT, 'pong')
+        await asyncio.sleep(0.02)
+        assert ws.sent == ['pong2', 'call']
+        writer.close()
+
+    asyncio.run(main())
+
+
+def test_senders_wait_at_high_water_mark():
+    async def main():
+        ws = SlowSocket()
+        writer = FrameWriter(ws, maxFrames=2)
+        sends = [asyncio.ensure_future(writer.send(f'call{i}')) for i in range(10)]
+        await asyncio.sleep(0)
+        assert len(writer.queue) <= 2
+        assert not all(s.done() for s in sends)
+        # Heartbeats are never held back
+        writer.put('pong', PRIORITY_HEARTBEAT)
+        await asyncio.gather(*sends)
+        await asyncio.sleep(0.05)
+        assert sorted(ws.sent) == sorted([f'call{i}' for i in range(10)] + ['pong'])
+        writer.close()
+
+    asyncio.run(main())
+
+
+def test_abandoned_sends_stop_waiting_and_are_dropped():
+    async def main():
+        ws = BlockedSocket()
+        writer = FrameWriter(ws, maxFrames=1)
+        writer.put('first')
+        writer.put('second')
+        abandoned = asyncio.get_event_loop().create_future()
+        send = asyncio.ensure_future(writer.send('late', abandoned=abandoned))
+        await asyncio.sleep(0.01)
+        assert not send.done()
+        abandoned.cancel()
+        await asyncio.wait_for(send, 1)
+        ws.released.set()
+        await asyncio.sleep(0.01)
+        assert ws.sent == ['first', 'second']
+        writer.close()
+
+    asyncio.run(main())
+
+
+def test_call_timeout_bounds_the_wait_for_room():
+    async def main():
+        c, ws = blockedClient(callTimeout=0.05)
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        with pytest.raises(asyncio.TimeoutError, match='No reply from server'):
+            await asyncio.wait_for(c.serverCall('get', 'devs', 'a'), 1)
+        assert time.perf_counter() - start < 0.5
+        ws.released.set()
+        await asyncio.sleep(0.01)
+        assert ws.sent == ['stuck being written', 'fills the queue']
+        assert c.pendingCalls == {}
+        c.writer.close()
+
+    asyncio.run(main())
+
+
+def test_cancel_while_waiting_to_send_frees_slot():
+    async def main():
+        c, ws = blockedClient(callTimeout=None, maxInFlight=3)
+        await asyncio.sleep(0)
+        call = asyncio.ensure_future(c.serverCall('get', 'devs', 'a'))
+        await asyncio.sleep(0.01)
+        call.cancel()
+        await asyncio.gather(call, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert c.pendingCalls == {}
+        assert c.callWindow._value == 3
+        c.writer.close()
+
+    asyncio.run(main())
+
+
+def test_pongs_are_encoded(client):
+    async def main(c):
+        await asyncio.sleep(0.05)
+        assert len(c.server.pongs) >= 2
+
+    client(main, pingInterval=0.01)